@@ -1,17 +1,29 @@
 #! /usr/bin/python3
 
 import argparse
+import logging
 import os
 import time
 import io
-from log import logger, searcher_handler, tests_handler
+import todotracker_log as log
+from todotracker_log import logger
 import re
-import unittest
 import sys
+import json
+import collections
+import locale
+import codecs
+import fnmatch
+import heapq
+import threading
+import queue
+import array
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
 
-from tkinter import StringVar, Entry, Toplevel, LEFT, Tk
-from tkinter import ttk
-from tkinter import filedialog
 
 version = 'V2.01.02.01'
 versiondate = 'Mon Mar  5 12:12:39 2018'
@@ -19,12 +31,1347 @@ buildname = 'TodoTracker'
 versionstr = '%s %s (c) Eclectick Media Solutions, circa %s' % (buildname,
                                                                 version,
                                                                 versiondate)
+header = ('TODO MASTER (%s)                  *Generated by github.com/'
+          'eclectickmedia/todotracker*\n--------\n')
 
 
 ################################################################################
 #                                LOGIC FUNCS                                   #
 #                                                                              #
 #                 Implement file heirarchy searching logic.                    #
+SNIFF_SIZE = 8192  # bytes checked for NUL by `skip_binary`
+
+
+def _decode(data, encodings=None):
+    """ Decodes the bytes `data` with the first of `encodings` that succeeds,
+    or with the locale's preferred encoding if `encodings` is None. Raises
+    `UnicodeDecodeError` if none succeed.
+    """
+    encodings = encodings or [locale.getpreferredencoding(False)]
+    for encoding in encodings[:-1]:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+
+    return data.decode(encodings[-1])
+
+
+def _is_binary(filepath):
+    """ Returns True if the first `SNIFF_SIZE` bytes of `filepath` contain a
+    NUL byte, which text files don't. """
+    with open(filepath, 'rb') as infile:
+        return b'\0' in infile.read(SNIFF_SIZE)
+
+
+def _match_lines(regex, filepath, stats=None, literals=None, encodings=None,
+                 skip_binary=False, fold=False):
+    """ Returns a list of `(line number, line)` pairs from `filepath` that
+    match the compiled `regex`. Returns an empty list if `filepath` could not be
+    decoded.
+
+    If `stats` (a `dict`) is given, the time spent in each phase is recorded in
+    it, see `_profile_lines`.
+
+    If `literals` is given, every line `regex` matches must contain one of
+    them. The file is then read whole and skipped unless it contains one. If
+    `fold`, the literals are case folded and so is the file before the check.
+
+    `encodings` - Encodings to read the file with, in turn, until one decodes
+                  the whole file. Defaults to the locale's preferred encoding.
+                  End the list with 'latin-1', which decodes any bytes, to
+                  never skip a file.
+    `skip_binary` - If True, files `_is_binary` finds binary are skipped.
+    """
+    if stats is not None:
+        return _profile_lines(regex, filepath, stats, literals, encodings,
+                              skip_binary, fold)
+
+    if skip_binary and _is_binary(filepath):
+        logger.debug('%s is binary', filepath)
+        return []
+
+    for encoding in encodings or [None]:
+        try:
+            return _read_lines(regex, filepath, literals, encoding, fold)
+        except UnicodeDecodeError:
+            logger.debug('%s throws UnicodeDecodeError (%s)', filepath,
+                         encoding)
+
+    return []
+
+
+def _read_lines(regex, filepath, literals, encoding, fold):
+    """ Reads `filepath` in text mode with `encoding`, for `_match_lines`. """
+    matches = []
+    with open(filepath, encoding=encoding) as infile:
+        if literals:
+            text = infile.read()
+            if not _contains_any(text, literals, fold):
+                return []
+            # Line endings were translated by `read`, split on '\n' only.
+            lines = io.StringIO(text, newline='\n')
+        else:
+            lines = infile
+
+        for i, line in enumerate(lines):
+            if regex.search(line):
+                matches.append((i, line))
+
+    return matches
+
+
+def _profile_lines(regex, filepath, stats, literals=None, encodings=None,
+                   skip_binary=False, fold=False):
+    """ `_match_lines` with separate phases, recording the seconds spent on
+    'read', 'decode' and 'regex', the file size as 'bytes', and whether the
+    file was skipped as 'binary' or failed to decode as 'decode_failed' in
+    `stats`. Reading the whole file before decoding it is slower than reading
+    in text mode, so this is only used when profiling.
+    """
+    start = time.perf_counter()
+    with open(filepath, 'rb') as infile:
+        data = infile.read()
+    stats['read'] = time.perf_counter() - start
+    return _match_data(regex, filepath, data, stats, literals, encodings,
+                       skip_binary, fold)
+
+
+def _match_data(regex, filepath, data, stats, literals=None, encodings=None,
+                skip_binary=False, fold=False):
+    """ Returns the `(line number, line)` pairs of the bytes `data`, read from
+    `filepath`, that match `regex`, recording every phase but 'read' in
+    `stats` as `_profile_lines` does. """
+    read = time.perf_counter()
+    stats['bytes'] = len(data)
+    if skip_binary and b'\0' in data[:SNIFF_SIZE]:
+        logger.debug('%s is binary', filepath)
+        stats['binary'] = True
+        return []
+
+    try:
+        text = _decode(data, encodings)
+    except UnicodeDecodeError:
+        logger.debug('%s throws UnicodeDecodeError', filepath)
+        stats['decode_failed'] = True
+        return []
+    finally:
+        stats['decode'] = time.perf_counter() - read
+
+    decoded = time.perf_counter()
+    matches = []
+    if literals and not _contains_any(text, literals, fold):
+        stats['regex'] = time.perf_counter() - decoded
+        return matches
+
+    # newline=None translates line endings as text mode does.
+    for i, line in enumerate(io.StringIO(text, newline=None)):
+        if regex.search(line):
+            matches.append((i, line))
+    stats['regex'] = time.perf_counter() - decoded
+    return matches
+
+
+def _contains_any(text, literals, fold=False):
+    """ Returns True if `text` (a `str`, `bytes` or `mmap`) contains any of
+    `literals`, comparing case folded `text` if `fold`. """
+    if fold:
+        text = text.casefold()
+    return any(text.find(literal) != -1 for literal in literals)
+
+
+# A leading or trailing `.*` (not possessive) and the inline flags before it.
+_LEADING_ANY = re.compile(r'^((?:\(\?[aiLmsux]+\))*)\.\*\??(?![*+?{])')
+_TRAILING_ANY = re.compile(r'(?<!\\)((?:\\\\)*)\.\*\??$')
+
+
+# The ASCII letters `re.IGNORECASE` also matches non-ASCII characters to,
+# unless the pattern is `re.ASCII`: 'İ' and 'ı' for 'i', the Kelvin sign for
+# 'k' and 'ſ' for 's'.
+_UNICODE_FOLDS = frozenset('iks')
+
+
+def _is_any_repeat(item):
+    """ Returns True if the parsed pattern `item` is `.*` or `.*?`. """
+    op, av = item
+    return (op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and
+            av[:2] == (0, sre_parse.MAXREPEAT) and
+            list(av[2]) == [(sre_parse.ANY, None)])
+
+
+def _literal_runs(parsed):
+    """ Returns the runs of literal characters found in sequence in the
+    parsed pattern `parsed`, each of which is part of every match. Groups are
+    followed into; anything else (classes, repeats, alternation, anchors) ends
+    a run.
+    """
+    runs = ['']
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            runs[-1] += chr(av)
+        elif op == sre_parse.SUBPATTERN and not av[1] and not av[2]:
+            inner = _literal_runs(av[3])
+            runs[-1] += inner[0]
+            runs.extend(inner[1:])
+        else:
+            runs.append('')
+    return runs
+
+
+def _plan_regex(regex):
+    """ Analyses the compiled `regex` to make searching with it cheaper.
+
+    `returns` - `(search regex, literals, fold)`:
+        `search regex` - `regex` without a leading or trailing `.*`, which
+            `search` doesn't need but backtracks through on every line. It
+            finds the same lines as `regex`, but not the same match text, so
+            `Searcher.records` still uses `regex`.
+        `literals` - A tuple with the longest run of literal characters every
+            match contains, for the engines' `literals` prefilter, or None.
+        `fold` - True if `regex` ignores case, the literal is then case folded.
+            Only ASCII literals are folded, and unless `regex` is `re.ASCII`
+            only those without a letter in `_UNICODE_FOLDS`, which
+            `casefold` can't match the way `re.IGNORECASE` does.
+    """
+    pattern = regex.pattern
+    if not isinstance(pattern, str):
+        return regex, None, False
+
+    parsed = sre_parse.parse(pattern, regex.flags)
+    items = list(parsed)
+    if not regex.flags & re.VERBOSE:
+        if items and _is_any_repeat(items[0]) and _LEADING_ANY.search(pattern):
+            pattern = _LEADING_ANY.sub(r'\1', pattern, 1)
+            items.pop(0)
+        if items and _is_any_repeat(items[-1]) and _TRAILING_ANY.search(
+                pattern):
+            pattern = _TRAILING_ANY.sub(r'\1', pattern, 1)
+
+    fold = bool(regex.flags & re.IGNORECASE)
+    literal = max(_literal_runs(parsed), key=len)
+    if fold:
+        literal = literal.casefold()
+        if not literal.isascii() or not regex.flags & re.ASCII and (
+                _UNICODE_FOLDS.intersection(literal)):
+            literal = ''
+    literals = (literal,) if literal else None
+    if pattern != regex.pattern:
+        regex = re.compile(pattern, regex.flags)
+    return regex, literals, fold
+
+
+def _bytes_regex(regex):
+    """ Returns a bytes, `re.MULTILINE` compilation of the compiled `regex` for
+    matching a whole file buffer, or None if `regex` can't be matched byte-wise
+    (non-ASCII patterns, or patterns anchored with \\A or \\Z).
+    """
+    pattern = regex.pattern
+    if '\\A' in pattern or '\\Z' in pattern:
+        return None
+
+    try:
+        return re.compile(pattern.encode('ascii'),
+                          (regex.flags & ~re.UNICODE) | re.MULTILINE)
+    except (UnicodeEncodeError, ValueError, re.error):
+        return None
+
+
+def _match_mmap(regex, filepath, stats=None, literals=None, encodings=None,
+                skip_binary=False, fold=False):
+    """ Returns the same `(line number, line)` pairs as `_match_lines`, but
+    memory maps `filepath` and searches the whole buffer at once, counting
+    newlines only up to each hit. Each hit line is decoded and checked against
+    `regex` on its own, so patterns that match across lines in the buffer
+    don't produce extra results. Files containing carriage returns are copied
+    with their line endings translated, as text mode does.
+
+    Matching is byte-wise, so a single-character wildcard or class in `regex`
+    only matches an ASCII character. Falls back to `_match_lines` for patterns
+    `_bytes_regex` rejects.
+
+    Only hit lines are decoded, so bytes elsewhere that `encodings` can't
+    decode don't matter. A hit line none of `encodings` can decode is decoded
+    with the first, replacing the bytes it can't decode, so its match is still
+    reported. With `skip_binary`, the first `SNIFF_SIZE` bytes are checked
+    for NUL before anything else is done.
+
+    If `stats` is given, phases are recorded in it as by `_profile_lines`.
+    'regex' includes the time spent finding line boundaries.
+
+    If `literals` is given, the buffer is skipped unless it contains one, as
+    in `_match_lines`. Only ASCII characters are folded if `fold`.
+    """
+    bregex = _bytes_regex(regex)
+    if bregex is None:
+        return _match_lines(regex, filepath, stats, literals, encodings,
+                            skip_binary, fold)
+
+    try:
+        bliterals = [literal.encode('ascii') for literal in literals or ()]
+    except UnicodeEncodeError:
+        bliterals = []
+    if bliterals and fold:
+        # Searches the buffer in place, where lower() would copy it.
+        bliterals = re.compile(b'|'.join(map(re.escape, bliterals)),
+                               re.IGNORECASE)
+
+    encodings = encodings or [locale.getpreferredencoding(False)]
+    matches = []
+    start_time = time.perf_counter()
+    decode_time = 0
+    import mmap
+
+    with open(filepath, 'rb') as infile:
+        try:
+            buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files can't be mapped
+            return []
+
+        with buf:
+            if skip_binary and buf.find(b'\0', 0, SNIFF_SIZE) != -1:
+                logger.debug('%s is binary', filepath)
+                if stats is not None:
+                    stats['binary'] = True
+                return []
+
+            mapped_time = time.perf_counter()
+            data = buf
+            if buf.find(b'\r') != -1:
+                data = buf[:].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+            size = len(data)
+            pos = counted = lineno = 0
+            # bregex only folds ASCII case, so neither does the prefilter.
+            if fold and bliterals:
+                found = bliterals.search(data) is not None
+            else:
+                found = not bliterals or _contains_any(data, bliterals)
+            if not found:
+                pos = size  # no line can match
+            while pos < size:
+                match = bregex.search(data, pos)
+                if match is None:
+                    break
+
+                start = data.rfind(b'\n', 0, match.start()) + 1
+                if start >= size:  # empty match after the final newline
+                    break
+
+                end = data.find(b'\n', match.start())
+                end = size if end == -1 else end + 1
+                lineno += data[counted:start].count(b'\n')
+                counted = start
+                decode_start = time.perf_counter()
+                try:
+                    line = _decode(data[start:end], encodings)
+                except UnicodeDecodeError:
+                    logger.debug('%s:%s throws UnicodeDecodeError', filepath,
+                                 lineno)
+                    line = data[start:end].decode(encodings[0], 'replace')
+                decode_time += time.perf_counter() - decode_start
+
+                if regex.search(line):
+                    matches.append((lineno, line))
+                pos = end
+
+    if stats is not None:
+        stats['bytes'] = size
+        stats['read'] = mapped_time - start_time
+        stats['decode'] = decode_time
+        stats['regex'] = time.perf_counter() - mapped_time - decode_time
+    return matches
+
+
+ENGINES = {'line': _match_lines, 'mmap': _match_mmap}
+
+
+def _split_path(path):
+    """ Returns the components of the absolute, normalized `path`. """
+    return os.path.abspath(path).split(os.sep)
+
+
+class BudgetExceeded(Exception):
+    """ Raised by `SIGALRM` when a file takes longer than its time budget. """
+
+
+def _budget_exceeded(signum, frame):
+    raise BudgetExceeded()
+
+
+def _can_budget():
+    """ Returns True if a time budget can be enforced here: `SIGALRM` handlers
+    can only be set from the main thread, and not at all on Windows. """
+    import signal
+
+    return (hasattr(signal, 'setitimer') and
+            threading.current_thread() is threading.main_thread())
+
+
+def _match_file(args):
+    """ Process pool entry point for the `ENGINES` functions. `args` is a
+    `(engine function, regex, filepath, profile, budget, options)` tuple,
+    where `options` holds the engine's keyword arguments, see `Searcher._task`.
+
+    If `budget` (seconds) is set, matching is interrupted once it runs out, so
+    a pattern that backtracks catastrophically can't hang the search. The file
+    is then reported with no matches and 'timed_out' set in its `stats`.
+
+    `returns` - `(filepath, matches, stats)`, where `stats` is the `dict` of
+    phase timings filled by the engine if `profile`, otherwise None (unless
+    the file timed out).
+    """
+    match, regex, filepath, profile, budget, options = args
+    stats = {} if profile else None
+    try:
+        return filepath, _call_with_budget(
+            budget, match, regex, filepath, stats, **options), stats
+    except OSError:  # file vanished or became unreadable after the walk
+        logger.debug('Could not open %s', filepath)
+        return filepath, [], stats
+    except BudgetExceeded:
+        logger.warning('%s took longer than %ss, skipped', filepath, budget)
+        stats = stats if stats is not None else {}
+        stats['timed_out'] = True
+        return filepath, [], stats
+
+
+def _call_with_budget(budget, function, *args, **kwargs):
+    """ Returns `function(*args, **kwargs)`, raising `BudgetExceeded` if it
+    takes longer than `budget` seconds. The budget is ignored if None or if
+    `_can_budget` returns False. """
+    if not budget or not _can_budget():
+        return function(*args, **kwargs)
+
+    import signal
+
+    previous = signal.signal(signal.SIGALRM, _budget_exceeded)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+ARCHIVE_TYPES = ('.zip', '.whl', '.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz')
+
+
+def _archive_errors():
+    """ Returns the exceptions raised for an unreadable archive. The archive
+    modules are imported here rather than at startup, since only
+    `--archives` searches use them. """
+    import lzma
+    import tarfile
+    import zipfile
+    import zlib
+    return (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError,
+            lzma.LZMAError, zlib.error)
+
+
+def _is_archive(name):
+    """ Returns True if the file name `name` ends with one of
+    `ARCHIVE_TYPES`. """
+    return name.lower().endswith(ARCHIVE_TYPES)
+
+
+def _match_target(args):
+    """ Process pool entry point for `Searcher._task` tuples.
+
+    `returns` - A list of `_match_file` results: one for a file, one for each
+    searched member of an archive (see `_match_archive`).
+    """
+    if 'archive' in args[5]:
+        return _match_archive(args)
+    return [_match_file(args)]
+
+
+def _match_archive(args):
+    """ Searches the members of the archive in `args`, a `_match_file` tuple
+    whose options include 'archive', the `Searcher` the task is for.
+
+    Members are read into memory and matched by `_match_data`, whatever the
+    engine. Only members that pass `Searcher._validate_file` are searched, and
+    archives inside the archive are opened while fewer than
+    `Searcher.archive_depth` archives deep. Members larger than
+    `Searcher.archive_max_size` bytes are skipped. If `budget` is set, each
+    member gets its own.
+
+    `returns` - A list of `(member path, matches, stats)`, where member paths
+    are `archive!/member` (i.e 'dist.tar.gz!/dist/setup.py'). `stats` is as
+    for `_match_file`, less the 'read' phase.
+    """
+    match, regex, filepath, profile, budget, options = args
+    options = dict(options)
+    searcher = options.pop('archive')
+    results = []
+    try:
+        with open(filepath, 'rb') as infile:
+            for member, data in _archive_members(
+                    infile, filepath, searcher, searcher.archive_depth):
+                stats = {}
+                try:
+                    matches = _call_with_budget(
+                        budget, _match_data, regex, member, data, stats,
+                        **options)
+                except BudgetExceeded:
+                    logger.warning('%s took longer than %ss, skipped', member,
+                                   budget)
+                    stats['timed_out'] = True
+                    matches = []
+                results.append((member, matches, stats if profile or
+                                stats.get('timed_out') else None))
+    except _archive_errors() as e:
+        logger.warning('Could not read archive %s: %s', filepath, e)
+
+    return results
+
+
+def _archive_members(fileobj, path, searcher, depth):
+    """ Yields `(member path, data)` for the members of the archive `fileobj`,
+    named `path`, that `searcher` would search, see `_match_archive`. """
+    for name, size, read in _list_archive(fileobj, path):
+        member = '%s!/%s' % (path, name)
+        basename = name.rsplit('/', 1)[-1]
+        nested = depth > 1 and searcher._validate_archive(basename)
+        if not nested and not searcher._validate_file(basename):
+            continue
+
+        if size > searcher.archive_max_size:
+            logger.warning('%s is larger than %s bytes, skipped', member,
+                           searcher.archive_max_size)
+            continue
+
+        if not nested:
+            yield member, read()
+            continue
+
+        try:
+            yield from _archive_members(io.BytesIO(read()), member, searcher,
+                                        depth - 1)
+        except _archive_errors() as e:
+            logger.warning('Could not read archive %s: %s', member, e)
+
+
+def _list_archive(fileobj, path):
+    """ Yields `(name, size, read)` for every regular file in the zip (if
+    `path` ends in .zip or .whl) or tar archive `fileobj`, where `read()`
+    returns the file's contents. Compressed tar archives are decompressed as
+    they are read. """
+    import tarfile
+    import zipfile
+
+    if path.lower().endswith(('.zip', '.whl')):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield (info.filename, info.file_size,
+                           lambda info=info: archive.read(info))
+        return
+
+    with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+        for info in archive:
+            if info.isfile():
+                yield (info.name, info.size,
+                       lambda info=info: archive.extractfile(info).read())
+
+
+class _GitEntry:
+    """ Stands in for the `os.DirEntry` of a file listed by git, see
+    `Searcher._walk_git`. """
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+class ScanStats:
+    """ Collects per-phase timings and file counts for one search, see
+    `Searcher.stats`.
+
+    Phase times are summed over every file, so with more than one job they
+    can add up to more than the wall clock time in `elapsed`.
+    """
+    PHASES = ('walk', 'validate', 'read', 'decode', 'regex')
+
+    def __init__(self, slowest=10):
+        """ `slowest` - The number of slowest files to keep. """
+        self.phases = dict.fromkeys(self.PHASES, 0.0)
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.cached = 0
+        self.decode_failed = 0
+        self.binary = 0
+        self.timed_out = 0
+        self.matched = 0
+        self.matches = 0
+        self.elapsed = 0.0
+        self.slowest = []  # a heap of (seconds, filepath)
+        self._slowest_count = slowest
+
+    def add_file(self, filepath, matches, stats):
+        """ Records a parsed file, given the `stats` returned by `_match_file`
+        (None for a file served from the cache).
+        """
+        self.files += 1
+        if matches:
+            self.matched += 1
+            self.matches += len(matches)
+
+        if stats is None:
+            self.cached += 1
+            return
+
+        seconds = 0.0
+        for phase in ('read', 'decode', 'regex'):
+            self.phases[phase] += stats.get(phase, 0.0)
+            seconds += stats.get(phase, 0.0)
+        self.bytes += stats.get('bytes', 0)
+        self.decode_failed += bool(stats.get('decode_failed'))
+        self.binary += bool(stats.get('binary'))
+        self.timed_out += bool(stats.get('timed_out'))
+
+        if len(self.slowest) < self._slowest_count:
+            heapq.heappush(self.slowest, (seconds, filepath))
+        else:
+            heapq.heappushpop(self.slowest, (seconds, filepath))
+
+    def as_dict(self):
+        """ Returns the collected stats as a `dict` suitable for JSON. """
+        elapsed = self.elapsed or float('nan')
+        return {
+            'elapsed': self.elapsed,
+            'phases': self.phases,
+            'files': self.files,
+            'bytes': self.bytes,
+            'files_per_second': self.files / elapsed,
+            'bytes_per_second': self.bytes / elapsed,
+            'skipped': self.skipped,
+            'cached': self.cached,
+            'decode_failed': self.decode_failed,
+            'binary': self.binary,
+            'timed_out': self.timed_out,
+            'matched': self.matched,
+            'matches': self.matches,
+            'slowest': [{'path': filepath, 'seconds': seconds} for
+                        seconds, filepath in sorted(self.slowest,
+                                                    reverse=True)]
+        }
+
+    def dump(self, outpath):
+        """ Writes `as_dict` to `outpath` as JSON. """
+        with open(outpath, 'w') as outfile:
+            json.dump(self.as_dict(), outfile, indent=2)
+
+    def report(self):
+        """ Returns the collected stats as a printable table. """
+        stats = self.as_dict()
+        total = sum(self.phases.values()) or float('nan')
+        lines = ['%-10s %10s %7s' % ('phase', 'seconds', '%')]
+        for phase in self.PHASES:
+            lines.append('%-10s %10.4f %7.1f' % (
+                phase, self.phases[phase], 100 * self.phases[phase] / total))
+
+        lines.extend([
+            '',
+            '%s files: %s skipped, %s cached, %s binary, %s decode failed, '
+            '%s timed out, %s matched (%s matches)' % (
+                self.files + self.skipped, self.skipped, self.cached,
+                self.binary, self.decode_failed, self.timed_out, self.matched,
+                self.matches),
+            '%.1f MB in %.3fs: %.1f files/s, %.1f MB/s' % (
+                self.bytes / 1e6, self.elapsed, stats['files_per_second'],
+                stats['bytes_per_second'] / 1e6),
+            '',
+            'slowest files:'])
+        for entry in stats['slowest']:
+            lines.append('%10.4fs %s' % (entry['seconds'], entry['path']))
+
+        return '\n'.join(lines)
+
+
+class FileMatcher:
+    """ Matches file names against a list of rules, compiled once.
+
+    Rules containing glob characters (`*`, `?`, `[`) are matched against the
+    whole file name (or its extensions, if `extensions`) by one combined regex.
+    Other rules are looked up in sets;
+    as extensions (any number of trailing suffixes, so 'gz' and 'tar.gz' both
+    match 'a.tar.gz') if `extensions`, otherwise as exact file names.
+
+        >>> FileMatcher(['py', 'tar.gz', 'test_*']).match('happy.txt')
+        False
+    """
+    def __init__(self, rules, extensions=True):
+        self.extensions = extensions
+        self.exact = set()
+        globs = []
+        for rule in rules:
+            if any(c in rule for c in '*?['):
+                if extensions:
+                    rule = '*.' + rule.lstrip('.')
+                globs.append(fnmatch.translate(rule))
+            elif extensions:
+                self.exact.add(rule.lstrip('.'))
+            else:
+                self.exact.add(rule)
+
+        self.glob = re.compile('|'.join(globs)) if globs else None
+        # How many trailing suffixes of a file name need to be looked up.
+        self.depth = max([rule.count('.') + 1 for rule in self.exact] or [0])
+
+    def match(self, name):
+        """ Returns True if the file name `name` matches any rule. """
+        if self.extensions:
+            parts = name.lstrip('.').rsplit('.', self.depth)[1:]
+            for i in range(len(parts)):
+                if '.'.join(parts[i:]) in self.exact:
+                    return True
+        elif name in self.exact:
+            return True
+
+        return self.glob is not None and self.glob.match(name) is not None
+
+
+IGNORE_FILES = ('.gitignore', '.todoignore')
+
+
+class IgnoreFile:
+    """ The patterns of one ignore file (see gitignore(5)), compiled once, for
+    paths below the directory `base`.
+
+    Patterns are combined into one regex per kind of path, in reverse order,
+    so the first alternative that matches is the last matching pattern, which
+    decides as in git.
+
+        >>> IgnoreFile('/src', ['*.log', '!keep.log']).match('/src/a/keep.log')
+        False
+    """
+    def __init__(self, base, lines):
+        self.base = base
+        rules = [rule for rule in map(self.translate, lines) if rule]
+        files = [rule for rule in rules if not rule[2]]
+        self._files, self._file_ignores = self._combine(files)
+        self._dirs, self._dir_ignores = self._combine(rules)
+
+    @staticmethod
+    def _combine(rules):
+        """ Returns the combined regex of `rules` and a list of whether
+        each group of it ignores or re-includes. """
+        if not rules:
+            return None, []
+        rules = rules[::-1]
+        return (re.compile('|'.join('(%s)' % rule[0] for rule in rules)),
+                [None] + [not rule[1] for rule in rules])
+
+    @staticmethod
+    def translate(line):
+        """ Translates a line of an ignore file to `(regex, negate,
+        dir_only)`, where `regex` matches the paths (relative to the ignore
+        file, separated by '/') the line applies to. Returns None for blank
+        lines and comments.
+        """
+        line = line.rstrip('\r\n')
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '  # an escaped trailing space is kept
+        line = stripped
+        if not line or line.startswith('#'):
+            return None
+
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+
+        # A pattern with a slash is relative to the ignore file's directory,
+        # others match at any depth below it.
+        anchored = '/' in line
+        parts = line.lstrip('/').split('/')
+        regex = '' if anchored else '(?:.*/)?'
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if part == '**':
+                regex += '.*' if last else '(?:.*/)?'
+            else:
+                regex += _ignore_glob(part) + ('' if last else '/')
+        return regex, negate, dir_only
+
+    def match(self, path, is_dir=False):
+        """ Returns True if `path` (below `self.base`) is ignored, False if a
+        negated pattern re-includes it, or None if no pattern matches. """
+        regex, ignores = ((self._dirs, self._dir_ignores) if is_dir else
+                          (self._files, self._file_ignores))
+        if regex is None:
+            return None
+
+        relpath = path[len(self.base):].lstrip(os.sep)
+        if os.sep != '/':
+            relpath = relpath.replace(os.sep, '/')
+        match = regex.fullmatch(relpath)
+        return None if match is None else ignores[match.lastindex]
+
+
+def _ignore_glob(part):
+    """ Translates one path component of an ignore pattern to a regex, where
+    wildcards never match '/'. """
+    regex = []
+    i = 0
+    while i < len(part):
+        c = part[i]
+        i += 1
+        if c == '\\' and i < len(part):
+            regex.append(re.escape(part[i]))
+            i += 1
+        elif c == '*':
+            regex.append('[^/]*')
+        elif c == '?':
+            regex.append('[^/]')
+        elif c == '[':
+            end = i + (part[i:i + 1] in ('!', '^'))
+            end = part.find(']', end + (part[end:end + 1] == ']'))
+            if end == -1:
+                regex.append('\\[')
+                continue
+            body = part[i:end].replace('\\', '\\\\').replace('[', '\\[')
+            i = end + 1
+            if body[:1] in ('!', '^'):
+                body = '^/' + body[1:]
+            regex.append('[%s]' % body)
+        else:
+            regex.append(re.escape(c))
+    return ''.join(regex)
+
+
+class _PollingMonitor:
+    """ Change source for `Watcher` that reports nothing, so every change is
+    found by comparing file metadata. Works on any platform. """
+    def wait(self, timeout):
+        """ Sleeps for `timeout` seconds, returns None (check every file). """
+        time.sleep(timeout)
+        return None
+
+    def update(self, dirs):
+        """ Called with every directory walked by a full check. """
+        pass
+
+    def close(self):
+        pass
+
+
+class _InotifyMonitor:
+    """ Change source for `Watcher` backed by Linux inotify (via `ctypes`),
+    reporting the paths of changed entries in the watched directories. """
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+    def __init__(self):
+        """ Raises OSError if inotify is not available. """
+        import ctypes
+        import ctypes.util
+        import struct
+
+        library = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or library is None:
+            raise OSError('inotify is only available on Linux')
+
+        self._libc = ctypes.CDLL(library, use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        self._event = struct.Struct('iIII')  # struct inotify_event
+
+    def update(self, dirs):
+        """ Watches each directory in `dirs` not already watched. """
+        watched = set(self.watches.values())
+        for path in dirs:
+            if path in watched:
+                continue
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                              self.MASK)
+            if wd >= 0:
+                self.watches[wd] = path
+
+    def wait(self, timeout):
+        """ Waits up to `timeout` seconds for events. Returns the set of
+        changed paths, or None if every file must be checked (a directory was
+        created, moved or deleted, or events were lost).
+        """
+        import select
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+
+        paths = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return paths
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self._event.unpack_from(data,
+                                                                   offset)
+                offset += self._event.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & self.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                elif mask & (self.IN_Q_OVERFLOW | self.IN_ISDIR):
+                    paths = None
+                elif paths is not None and wd in self.watches:
+                    paths.add(os.path.join(self.watches[wd],
+                                           os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """ Keeps an output file up to date with the files found by a `Searcher`.
+
+    After a full search, watches `searcher.path` for created, modified and
+    deleted files (with inotify on Linux, otherwise by comparing file
+    metadata every `interval` seconds), re-parses only those files and
+    rewrites the output file once no change has been seen for `debounce`
+    seconds.
+
+        >>> watcher = Watcher(Searcher(getcwd(), ['py']), 'to.do')
+        >>> watcher.watch()  # runs until interrupted
+    """
+    def __init__(self, searcher, outpath, debounce=0.5, interval=1.0,
+                 poll=False):
+        """ `searcher` - The `Searcher` whose settings are used.
+        `outpath` - The path of the file to keep up to date.
+        `debounce` - Seconds without changes to wait before rewriting.
+        `interval` - Seconds between checks.
+        `poll` - If True, compare file metadata even if inotify is available.
+        """
+        self.searcher = searcher
+        searcher._ignore_chains = {}  # consulted by `_diff`
+        self.outpath = outpath
+        self.debounce = debounce
+        self.interval = interval
+        self.results = {}  # filepath: matches, in output order
+        self._snapshot = {}  # filepath: (size, mtime_ns, inode)
+        self._monitor = None
+        if not poll:
+            try:
+                self._monitor = _InotifyMonitor()
+            except (OSError, AttributeError) as e:
+                logger.debug('inotify unavailable (%s), polling', e)
+        if self._monitor is None:
+            self._monitor = _PollingMonitor()
+
+    def scan(self):
+        """ Searches every file and writes the output file. """
+        self._diff(None)  # take the snapshot before files are read
+        self.results = collections.OrderedDict(self.searcher.iter_matches())
+        self.write()
+
+    def _diff(self, paths):
+        """ Compares the metadata of `paths` (None for every file below
+        `self.searcher.path`) with the last snapshot, which is updated. The
+        files to check are found as a search would find them, through
+        `Searcher._iter_valid`. With `searcher.git`, every file is checked
+        whatever `paths` is, as only git knows which are tracked.
+
+        `returns` - A `dict` of changed file paths to their new metadata, or
+        to None if they were deleted.
+        """
+        changes = {}
+        if paths is not None and self.searcher.git:
+            paths = None
+        if paths is None:
+            current = {}
+            dirs = []
+            for entry in self.searcher._iter_valid(dirs):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                current[entry.path] = (st.st_size, st.st_mtime_ns,
+                                       st.st_ino)
+            self._monitor.update(dirs)
+            for filepath in self._snapshot.keys() - current.keys():
+                changes[filepath] = None
+        else:
+            current = {}
+            for filepath in paths:
+                try:
+                    st = os.stat(filepath)
+                except OSError:
+                    if filepath in self._snapshot:
+                        changes[filepath] = None
+                    continue
+                chain = self.searcher._ignore_chains.get(
+                    os.path.dirname(filepath), ())
+                if (self.searcher._validate_target(
+                        os.path.basename(filepath)) and
+                        not self.searcher._is_ignored(chain, filepath)):
+                    current[filepath] = (st.st_size, st.st_mtime_ns,
+                                         st.st_ino)
+
+        for filepath, key in current.items():
+            if self._snapshot.get(filepath) != key:
+                changes[filepath] = key
+
+        for filepath, key in changes.items():
+            if key is None:
+                self._snapshot.pop(filepath, None)
+            else:
+                self._snapshot[filepath] = key
+        return changes
+
+    def apply(self, changes):
+        """ Re-parses the changed files in `changes` (as returned by `_diff`)
+        and forgets the deleted ones. A changed archive's members (keyed
+        `archive!/member`, see `_match_archive`) replace all of its previous
+        ones. Returns True if `self.results` changed.
+        """
+        updated = False
+        for filepath, key in changes.items():
+            found = {}
+            if key is not None:
+                for path, matches, _ in _match_target(
+                        self.searcher._task(filepath)):
+                    if matches:
+                        found[path] = matches
+
+            stale = [filepath]
+            if self.searcher._validate_archive(filepath):
+                stale = [path for path in self.results
+                         if path.split('!/', 1)[0] == filepath]
+            for path in stale:
+                if path not in found and self.results.pop(path, None):
+                    updated = True
+
+            for path, matches in found.items():
+                updated |= self.results.get(path) != matches
+                self.results[path] = matches
+
+        return updated
+
+    def write(self):
+        """ Replaces the output file with the current results. The file is
+        written under a temporary name first, so readers never see part of it.
+        """
+        temp_path = self.outpath + '.tmp'
+        with open(temp_path, 'w') as outfile:
+            outfile.write(header % time.ctime())
+            for filepath, matches in self.results.items():
+                outfile.write(Searcher._format_section(filepath, matches))
+        os.replace(temp_path, self.outpath)
+
+    def watch(self, stop=None):
+        """ Runs `scan`, then updates the output file as files change until
+        interrupted, or until the `threading.Event` `stop` is set.
+        """
+        stop = stop or threading.Event()
+        self.scan()
+        pending = {}
+        last_change = 0
+        try:
+            while not stop.is_set():
+                changes = self._diff(self._monitor.wait(self.interval))
+                now = time.monotonic()
+                if changes:
+                    pending.update(changes)
+                    last_change = now
+                elif pending and now - last_change >= self.debounce:
+                    if self.apply(pending):
+                        self.write()
+                        logger.info('updated %s (%s changed files)',
+                                    self.outpath, len(pending))
+                    pending = {}
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._monitor.close()
+
+
+class SearchWorker(threading.Thread):
+    """ Runs a search in a background thread, so that another thread (i.e
+    the Tk event loop) can poll its progress and results without blocking.
+
+    Messages are put on `self.queue` as `(kind, value)` pairs:
+        'result' - `(filepath, matches)` for each file with matches, as soon as
+                   it is parsed.
+        'progress' - A `dict` of 'files', 'matches', 'seconds' and
+                     'files_per_second', at most every `interval` seconds and
+                     once more at the end.
+        'done', 'cancelled', 'error' - Last, once the search stopped; with
+                                       the exception raised for 'error',
+                                       otherwise None.
+    """
+    def __init__(self, searcher, interval=0.1):
+        super(SearchWorker, self).__init__(daemon=True)
+        self.searcher = searcher
+        self.interval = interval
+        self.queue = queue.Queue()
+        self.files = 0
+        self.matches = 0
+        self.started = None
+
+    def cancel(self):
+        """ Stops the search, see `Searcher.cancel`. """
+        self.searcher.cancel()
+
+    def progress(self):
+        """ Returns the 'progress' message of the search so far. """
+        seconds = time.perf_counter() - self.started
+        return {'files': self.files, 'matches': self.matches,
+                'seconds': seconds,
+                'files_per_second': self.files / seconds if seconds else 0.0}
+
+    def run(self):
+        self.started = last = time.perf_counter()
+        try:
+            for filepath, matches in self.searcher.iter_matches(empty=True):
+                self.files += 1
+                if matches:
+                    self.matches += len(matches)
+                    self.queue.put(('result', (filepath, matches)))
+                if time.perf_counter() - last >= self.interval:
+                    last = time.perf_counter()
+                    self.queue.put(('progress', self.progress()))
+        except Exception as error:
+            logger.warning('search failed: %s', error)
+            self.queue.put(('error', error))
+            return
+
+        self.queue.put(('progress', self.progress()))
+        self.queue.put(('cancelled' if self.searcher.cancelled.is_set()
+                        else 'done', None))
+
+
+class Match:
+    """ One match found by `Searcher.search`: a view of a row of `Results`,
+    holding nothing but the row.
+
+    `path` - The file the match is in.
+    `line` - The line number, counting from 0.
+    `start`, `end` - The span of the match within `text`.
+    `text` - The line, without its line ending.
+    `tag` - The matched tag (see `Searcher.tags`), or None.
+    """
+    __slots__ = ('_results', '_row')
+
+    def __init__(self, results, row):
+        self._results = results
+        self._row = row
+
+    @property
+    def path(self):
+        return self._results.paths[self._results._file[self._row]]
+
+    @property
+    def line(self):
+        return self._results._line[self._row]
+
+    @property
+    def start(self):
+        return self._results._start[self._row]
+
+    @property
+    def end(self):
+        return self._results._end[self._row]
+
+    @property
+    def tag(self):
+        return self._results.tags[self._results._tag[self._row]]
+
+    @property
+    def text(self):
+        return self._results._raw_text(self._row).rstrip('\r\n')
+
+    def __eq__(self, other):
+        return (isinstance(other, Match) and
+                (self.path, self.line, self.start, self.end) ==
+                (other.path, other.line, other.start, other.end))
+
+    def __hash__(self):
+        return hash((self.path, self.line, self.start, self.end))
+
+    def __repr__(self):
+        return 'Match(%r, %s, %s, %s)' % (self.path, self.line, self.start,
+                                           self.end)
+
+
+class Results:
+    """ The matches of a search, see `Searcher.search`. Matches are stored in
+    columns of 4-byte integers (file, line, start, end and tag ids), so each
+    costs 20 bytes plus its line's text, or nothing more if the text isn't
+    kept. `Match` objects are only created when rows are accessed.
+
+        >>> results = Searcher('.', ['py']).search()
+        >>> [(match.path, match.line) for match in results if match.tag]
+    """
+    def __init__(self, searcher, keep_text=True):
+        """ `searcher` - The `Searcher` the results are for.
+        `keep_text` - If False, matched lines aren't kept. `Match.text`
+                      finds them again when first used, see `_raw_text`.
+        """
+        self.searcher = searcher
+        self.paths = []  # file id -> path
+        self.tags = [None]  # tag id -> tag
+        self._tag_ids = {None: 0}
+        self._file = array.array('I')
+        self._line = array.array('I')
+        self._start = array.array('I')
+        self._end = array.array('I')
+        self._tag = array.array('I')
+        self._texts = [] if keep_text else None
+        self._reread = None  # (file id, {line number: line}) of `_raw_text`
+
+    def add(self, filepath, matches):
+        """ Adds the `(line number, line)` pairs in `matches`, found in
+        `filepath`, as by `Searcher.iter_matches`. """
+        regex = self.searcher.regex
+        has_tag = 'tag' in regex.groupindex
+        file_id = len(self.paths)
+        self.paths.append(filepath)
+        for i, line in matches:
+            match = regex.search(line)
+            tag = match.group('tag') if has_tag else None
+            tag_id = self._tag_ids.get(tag)
+            if tag_id is None:
+                tag_id = self._tag_ids[tag] = len(self.tags)
+                self.tags.append(tag)
+
+            self._file.append(file_id)
+            self._line.append(i)
+            self._start.append(match.start())
+            self._end.append(match.end())
+            self._tag.append(tag_id)
+            if self._texts is not None:
+                self._texts.append(line)
+
+    def _raw_text(self, row):
+        """ Returns the line of `row`, with its line ending. If the text isn't
+        kept, the row's file is matched again as the search matched it (with
+        the searcher's engine and encodings, see `_match_target`), keeping
+        only the matching lines of the last file read. A line that no longer
+        matches (i.e the file changed since the search) is logged and given
+        as ''.
+        """
+        if self._texts is not None:
+            return self._texts[row]
+
+        file_id = self._file[row]
+        if self._reread is None or self._reread[0] != file_id:
+            path = self.paths[file_id]
+            target = path.split('!/', 1)[0]  # the archive of a member
+            self._reread = (file_id, {
+                i: line
+                for member, matches, _ in _match_target(
+                    self.searcher._task(target))
+                if member == path for i, line in matches})
+
+        line = self._reread[1].get(self._line[row])
+        if line is None:
+            logger.warning('line %s of %s no longer matches',
+                           self._line[row], self.paths[file_id])
+            return ''
+        return line
+
+    def find(self, text, rows=None):
+        """ Returns the rows, in order, whose line contains `text`, ignoring
+        case. Only `rows` (an iterable of rows) are searched if given, i.e the
+        rows found for a shorter `text`.
+        """
+        text = text.casefold()
+        if rows is None:
+            rows = range(len(self))
+        return [row for row in rows if text in self._raw_text(row).casefold()]
+
+    def __len__(self):
+        return len(self._line)
+
+    def __getitem__(self, row):
+        if not -len(self) <= row < len(self):
+            raise IndexError('Results index out of range')
+        return Match(self, row % len(self))
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield Match(self, row)
+
+    def iter_matches(self):
+        """ Yields `(filepath, matches)` per file, where `matches` is a list of
+        `(line number, line)` pairs, as `Searcher.iter_matches` does. """
+        row = 0
+        while row < len(self):
+            file_id = self._file[row]
+            matches = []
+            while row < len(self) and self._file[row] == file_id:
+                matches.append((self._line[row], self._raw_text(row)))
+                row += 1
+            yield self.paths[file_id], matches
+
+    def write(self, outpath, writer=None):
+        """ Writes the results to `outpath` with `writer`, one of the `FORMATS`
+        values (`TextWriter` by default, which writes the to.do format).
+
+        `returns` - The number of files written.
+        """
+        writer_class = writer or TextWriter
+        count = 0
+        with open(outpath, 'w', newline=writer_class.newline) as outfile:
+            writer = writer_class(outfile, self.searcher)
+            writer.begin()
+            for filepath, matches in self.iter_matches():
+                writer.write(filepath, matches)
+                count += 1
+            writer.end()
+
+        return count
+
+
+SORT_MEMORY = 64 * 2 ** 20  # bytes of results `write_sorted` holds at once
+
+
+def _write_run(results, path):
+    """ Writes the list of `(filepath, matches)` pairs `results`, sorted by
+    file path, to `path` as JSON lines. Returns `path`. """
+    results.sort(key=lambda result: result[0])
+    with open(path, 'w', encoding='utf-8') as outfile:
+        for result in results:
+            outfile.write(json.dumps(result) + '\n')
+    return path
+
+
+def _read_run(path):
+    """ Yields the `(filepath, matches)` pairs written by `_write_run` to
+    `path`. """
+    with open(path, encoding='utf-8') as infile:
+        for line in infile:
+            filepath, matches = json.loads(line)
+            yield filepath, [tuple(match) for match in matches]
+
+
 class Searcher:
     """ Implements file and line searching functionality.
 
@@ -36,138 +1383,943 @@ class Searcher:
         >>> searcher_log.getvalue()  # outputs contents
     """
     def __init__(self, path, types, extensions=list(), files=list(),
-                 epaths=list(), regex=r'(?!).*# TODO.*', quiet=False):
+                 epaths=list(), regex=r'(?!).*# TODO.*', quiet=False, jobs=1,
+                 cache=None, engine='line', substring=False,
+                 followlinks=False, profile=False, tags=None, encodings=None,
+                 skip_binary=False, budget=None, archives=False,
+                 archive_depth=2, archive_max_size=10 * 2 ** 20, git=False,
+                 since=None, ignore_files=IGNORE_FILES, shard=None):
         """ Initializes all data, writes initial line of output file.
 
-        `path` - The path to search from.
+        `path` - The path to search from, or a list of paths searched one
+                 after the other into the same results (see `_walk`).
         `types` - A list of file extensions that are valid search targets.
         `extensions` - An optional list of file extensions to ignore.
         `files` - An optional list of file names to ignore.
-        `epaths` An optional list of paths to ignore.
+        `epaths` An optional list of paths to ignore. Entries without a path
+                 separator exclude directories of that name anywhere, others
+                 exclude that path (relative to `path` unless absolute).
         `regex` - User supplied regex pattern to match against. (Passed to `re`)
+        `jobs` - The number of processes used to parse files. `1` parses files
+                 serially, `0` uses one process per CPU.
+        `cache` - An optional path to a JSON file storing per-file results
+                  between runs. Files whose size, mtime and inode are unchanged
+                  are served from the cache without being opened.
+        `engine` - The name of the `ENGINES` function used to match files.
+                   'line' searches each line of the file in text mode, 'mmap'
+                   searches the memory mapped file at once (see `_match_mmap`).
+        `substring` - If True, `types`, `extensions` and `files` match any file
+                      name containing them (the behaviour before `FileMatcher`)
+                      instead of exact extensions, names and globs.
+        `followlinks` - If True, descend into symbolic links to directories.
+        `profile` - If True, collect timings and counts for each search in
+                    `self.stats`.
+        `tags` - An optional list of words (i.e ['TODO', 'FIXME']) to search
+                 for instead of `regex`. Every tag is found in a single pass,
+                 files containing none of them are skipped after one read,
+                 and each match's tag is reported by `records`.
+        `encodings` - An optional list of encodings to try in turn when a file
+                      (or, with the 'mmap' engine, a matching line) can't be
+                      decoded with the first, i.e ['utf-8', 'latin-1'].
+                      Defaults to the locale's preferred encoding.
+        `skip_binary` - If True, skip files with a NUL byte in their first
+                        `SNIFF_SIZE` bytes.
+        `budget` - An optional number of seconds each file may take to match.
+                   Files taking longer are skipped and listed in
+                   `self.timed_out`. Only enforced where `SIGALRM` is
+                   available, from the main thread or with `jobs` > 1.
+        `archives` - If True, search the members of zip, wheel and tar
+                     archives (see `ARCHIVE_TYPES`) as if they were files,
+                     without extracting them. Members are reported as
+                     `archive!/member`, see `_match_archive`.
+        `archive_depth` - How many archives deep to open archives inside
+                          archives. `1` only searches archives found on disk.
+        `archive_max_size` - Archive members larger than this many bytes are
+                             skipped.
+        `git` - If True, search the files tracked by the git repository
+                `path` is in instead of walking `path`, see `_walk_git`.
+        `since` - An optional git ref (i.e 'HEAD~3' or 'origin/master'). Only
+                  files changed since it are searched, see `write_partial`.
+                  Implies `git`.
+        `ignore_files` - Names of the ignore files (see `IgnoreFile`) honored
+                         by the walk, in the directory they're found in and
+                         below. Later names override earlier ones. Ignored
+                         directories are not descended into. Pass an empty
+                         list to ignore nothing. With `git`, git's listing
+                         already leaves out ignored files.
+        `shard` - An optional `(k, n)` pair, counting `k` from 1. Only the
+                  k-th of `n` disjoint parts of the files is searched, split
+                  by a hash of each file's path relative to its search path,
+                  so that `n` hosts can search a tree between them. See
+                  `write_shard` and `merge_shards`.
 
         `initializes`:
             `self.exclude` - A `dict` with keys:
                 'extensions' - The list supplied by `extensions`
                 'files' - The list supplied by `files`
                 'paths' - The list supplied by `epaths`
-            `self.regex` - The result of `re.compile(regex)`
+            `self.regex` - The result of `re.compile(regex)`, or of a pattern
+                matching any of `tags` as the group 'tag'.
+            `self.literals` - Strings one of which every matching line
+                contains, or None. Used to skip files before matching lines.
+                Case folded if `self.fold`, see `_plan_regex`.
+            `self.timed_out` - The files skipped by the last search for
+                exceeding `budget`.
+            `self.cancelled` - A `threading.Event` set by `cancel`.
+            `self.covered` - With `shard`, `(index, filepath)` for each file
+                in the shard searched by the last search, where `index` is the
+                file's position among all the files searched without `shard`.
+            `self.paths` - The list of paths to search, `self.path` is the
+                first.
+            `self.header` - The first lines of the output file.
             `self.log` - An `io.StringIO` object used to store results.
+            `self.stats` - A `ScanStats` for the last search if `profile`,
+                otherwise None.
+            `self.cache_hits`, `self.cache_misses` - Counts of files served
+                from and missing from `cache` by the last `search_path` call.
         """
-        if not os.access(path, os.F_OK):
+        paths = [path] if isinstance(path, str) else list(path)
+        if not paths or not all(os.access(p, os.F_OK) for p in paths):
             raise OSError('Could not access search path')
 
         if type(types) is not list:
             raise ValueError('file types must be list')
 
-        self.path = path
+        if type(jobs) is not int or jobs < 0:
+            raise ValueError('jobs must be a positive int, or 0')
+
+        if engine not in ENGINES:
+            raise ValueError('engine must be one of %s' % ', '.join(ENGINES))
+
+        if tags is not None and (type(tags) is not list or not all(tags)):
+            raise ValueError('tags must be a list of non-empty strings')
+
+        if type(archive_depth) is not int or archive_depth < 1:
+            raise ValueError('archive_depth must be a positive int')
+
+        if budget is not None and budget <= 0:
+            raise ValueError('budget must be a positive number of seconds')
+
+        if encodings is not None:
+            if type(encodings) is not list or not encodings:
+                raise ValueError('encodings must be a non-empty list')
+            for encoding in encodings:
+                codecs.lookup(encoding)  # raises LookupError if unknown
+
+        if shard is not None and not (
+                len(shard) == 2 and all(type(x) is int for x in shard) and
+                1 <= shard[0] <= shard[1]):
+            raise ValueError('shard must be a (k, n) pair with 1 <= k <= n')
+
+        self.paths = paths
+        self.path = paths[0]
         self.types = types
         self.exclude = {
             'extensions': extensions,
             'files': files,
             'paths': epaths
         }
+        self.tags = tags
+        if tags:
+            # Longest first, so 'TODOS' isn't reported as 'TODO'.
+            regex = r'(?<!\w)(?P<tag>%s)(?!\w)' % '|'.join(
+                re.escape(tag) for tag in sorted(tags, key=len, reverse=True))
         self.regex = re.compile(regex)
+        self._search_regex, self.literals, self.fold = _plan_regex(self.regex)
+        if tags:
+            self.literals, self.fold = tuple(tags), False
+        self.budget = budget
+        self.timed_out = []
+        self.archives = archives
+        self.archive_depth = archive_depth
+        self.archive_max_size = archive_max_size
+        self.git = git or since is not None
+        self.since = since
+        self.removed = []
+        self.shard = None if shard is None else tuple(shard)
+        self.cancelled = threading.Event()
+        self.covered = []
+        self.ignore_files = list(ignore_files)
+        self._ignore_cache = {}  # path -> ((size, mtime), IgnoreFile)
+        # directory -> IgnoreFiles applying in it, kept by `_walk` for
+        # `Watcher` only, as it holds an entry per directory.
+        self._ignore_chains = None
+        self.substring = substring
+        self.followlinks = followlinks
+        self.encodings = encodings
+        self.skip_binary = skip_binary
+        self.profile = profile
+        self.stats = None
+        # Checked before logging in the hot path, refreshed for each search.
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+        self._types = FileMatcher(types)
+        self._exclude_extensions = FileMatcher(extensions)
+        self._exclude_files = FileMatcher(files, extensions=False)
         self.quiet = quiet
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = cache
+        self.engine = engine
+        self._match = ENGINES[engine]
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.header = header % time.ctime()
         self.log = io.StringIO()
-        self.log.write('TODO MASTER (%s)'
-                       '                  *Generated by github.com/'
-                       'eclectickmedia/todotracker*\n--------\n' % time.ctime())
+        self.log.write(self.header)
 
         # We have to use regex from the arguments to log the value of the regex
-        logger.debug('%s %s %s %s %s %s' % (version, self.path, self.types,
-                                            self.exclude, repr(regex),
-                                            self.quiet))
+        logger.debug('%s %s %s %s %s %s %s %s %s %s %s' % (
+            version, self.path, self.types, self.exclude, repr(regex),
+            self.quiet, self.jobs, self.cache, self.engine, self.substring,
+            self.followlinks))
+        logger.debug('search with %r, prefilter %s', self._search_regex.pattern,
+                     self.literals)
 
     def _validate_file(self, file):
         """ Compares file against `self.exclude`, and returns False if any match
         is made. Returns True if `file` is found in `self.types`.
+
+        Only the file name of `file` is compared, unless `self.substring`.
+        """
+        if self.substring:
+            return self._validate_file_substring(file)
+
+        name = os.path.basename(file)
+        if self._exclude_files.match(name):
+            if self._debug:
+                logger.debug('%s excluded by name', file)
+            return False
+
+        if self._exclude_extensions.match(name):
+            if self._debug:
+                logger.debug('%s excluded by extension', file)
+            return False
+
+        return self._types.match(name)
+
+    def _validate_archive(self, file):
+        """ Returns True if `self.archives` is set and `file` names an archive
+        that isn't excluded by `self.exclude`. """
+        if not self.archives or not _is_archive(file):
+            return False
+
+        name = os.path.basename(file)
+        return not (self._exclude_files.match(name) or
+                    self._exclude_extensions.match(name))
+
+    def _validate_target(self, file):
+        """ Returns True if `file` is searched, as a file or, with
+        `self.archives`, as an archive. """
+        return self._validate_archive(file) or self._validate_file(file)
+
+    def _validate_file_substring(self, file):
+        """ `_validate_file` for `self.substring`, where any rule found in
+        `file` is a match.
         """
         for efile in self.exclude['files']:
             if file.count(efile):
-                logger.debug('%s in %s, False' % (efile, file))
+                logger.debug('%s in %s, False', efile, file)
                 return False
 
         for ext in self.exclude['extensions']:
             if file.count(ext):
-                logger.debug('%s in %s, False' % (ext, file))
+                logger.debug('%s in %s, False', ext, file)
                 return False
 
         for t in self.types:
             if file.count(t):
-                logger.debug('%s in %s, true' % (t, file))
+                logger.debug('%s in %s, true', t, file)
                 return True
 
         else:  # no file type returned true
             return False
 
-    def __remove_dir(self, dirs):
-        """ Remove directories from a list of directories if they match against
-        `self.exclude['paths']`. Returns modified list of directories.
+    def _build_exclude_tree(self):
+        """ Splits `self.exclude['paths']` into directory names, pruned
+        wherever they appear, and paths (entries containing a separator),
+        pruned with everything below them. Relative paths are relative to
+        each of `self.paths`.
+
+        `returns` - `(names, tree)`, where `tree` is a prefix tree of absolute
+        path components: nested `dict`s whose leaves are True.
+        """
+        names = set()
+        tree = {}
+        for epath in self.exclude['paths']:
+            if os.sep not in epath and (os.altsep is None or
+                                        os.altsep not in epath):
+                names.add(epath)
+                continue
+
+            for root in self.paths:
+                node = tree
+                parts = _split_path(os.path.join(root, epath))
+                for part in parts[:-1]:
+                    node = node.setdefault(part, {})
+                    if node is True:  # a parent is already excluded
+                        break
+                else:
+                    node[parts[-1]] = True
+
+        return names, tree
+
+    def _walk(self):
+        """ Walks each of `self.paths` in turn, top down with `os.scandir`, in
+        `os.walk` order. Yields `(path, files)`, where `files` is a list of
+        `os.DirEntry` for every non-directory in `path`.
+
+        Directories matching `self.exclude['paths']` (see
+        `_build_exclude_tree`) are not descended into. Symbolic links to
+        directories are only descended into if `self.followlinks`, in which
+        case each directory is visited once by `(st_dev, st_ino)`. With more
+        than one path, every directory is visited once, so roots that overlap
+        are only walked where they don't.
+
+        Files and directories ignored by the `self.ignore_files` found on the
+        way (see `_load_ignores`) are left out, directories without being
+        descended into.
+        """
+        names, tree = self._build_exclude_tree()
+        multi = len(self.paths) > 1
+        visited = set()
+        if self._ignore_chains is not None:
+            self._ignore_chains = {}
+        for root in self.paths:
+            yield from self._walk_root(root, names, tree, visited, multi)
+
+    def _walk_root(self, root, names, node, visited, track_dirs):
+        """ `_walk` for the single path `root`, given the results of
+        `_build_exclude_tree` and the `(st_dev, st_ino)` of the directories
+        visited so far. Every directory is recorded in `visited` if
+        `track_dirs`, otherwise only `root` and symbolic links.
+        """
+        for part in _split_path(root):
+            node = node.get(part) if node else None
+            if node is True:
+                logger.debug('%s is excluded', root)
+                return
+
+        if self.followlinks or track_dirs:
+            st = os.stat(root)
+            if (st.st_dev, st.st_ino) in visited:
+                logger.debug('skip visited directory %s', root)
+                return
+            visited.add((st.st_dev, st.st_ino))
+
+        stack = [(root, node, ())]
+        while stack:
+            started = time.perf_counter()
+            path, node, chain = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError as e:
+                logger.debug('Could not scan %s: %s', path, e)
+                continue
+
+            if self.ignore_files:
+                chain = self._load_ignores(path, entries, chain)
+                if self._ignore_chains is not None:
+                    self._ignore_chains[path] = chain
+
+            files = []
+            dirs = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+
+                if chain and self._is_ignored(chain, entry.path, is_dir):
+                    if self._debug:
+                        logger.debug('%s is ignored', entry.path)
+                    continue
+
+                if not is_dir:
+                    files.append(entry)
+                    continue
+
+                child = node.get(entry.name) if node else None
+                if child is True or entry.name in names:
+                    logger.debug('remove directory %s', entry.path)
+                elif not entry.is_symlink():
+                    if track_dirs:
+                        st = entry.stat()
+                        if (st.st_dev, st.st_ino) in visited:
+                            logger.debug('skip visited directory %s',
+                                         entry.path)
+                            continue
+                        visited.add((st.st_dev, st.st_ino))
+                    dirs.append((entry.path, child, chain))
+                elif self.followlinks:
+                    st = entry.stat()
+                    if (st.st_dev, st.st_ino) in visited:
+                        logger.debug('skip visited directory %s', entry.path)
+                        continue
+                    visited.add((st.st_dev, st.st_ino))
+                    dirs.append((entry.path, child, chain))
+
+            if self.stats is not None:
+                self.stats.phases['walk'] += time.perf_counter() - started
+            yield path, files
+            stack.extend(reversed(dirs))
+
+    def _load_ignores(self, path, entries, chain):
+        """ Returns `chain`, the `IgnoreFile`s applying in the parent of the
+        directory `path`, followed by those of the `self.ignore_files` among
+        `entries`. Each ignore file is compiled once, and again only when its
+        size or mtime changes.
+        """
+        found = {entry.name: entry for entry in entries
+                 if entry.name in self.ignore_files}
+        if not found:
+            return chain
+
+        for name in self.ignore_files:
+            entry = found.get(name)
+            if entry is None:
+                continue
+
+            try:
+                st = entry.stat()
+                key = (st.st_size, st.st_mtime_ns)
+                cached = self._ignore_cache.get(entry.path)
+                if cached is None or cached[0] != key:
+                    with open(entry.path, encoding='utf-8',
+                              errors='replace') as infile:
+                        cached = key, IgnoreFile(path, infile.readlines())
+                    self._ignore_cache[entry.path] = cached
+            except OSError as e:
+                logger.debug('Could not read %s: %s', entry.path, e)
+                continue
+            chain += (cached[1],)
+        return chain
+
+    @staticmethod
+    def _is_ignored(chain, path, is_dir=False):
+        """ Returns True if the `IgnoreFile`s in `chain` ignore `path`. The
+        deepest ignore file with a matching pattern decides. """
+        for ignore in reversed(chain):
+            ignored = ignore.match(path, is_dir)
+            if ignored is not None:
+                return ignored
+        return False
+
+    def _git_files(self, root):
+        """ Returns the paths (relative to `root`, separated by '/') of the
+        files git tracks below `root`. With `self.since`, returns the tracked
+        files changed since that ref, including deleted ones, and the
+        untracked files that aren't ignored instead.
         """
-        dirs_ = dirs[:]
-        for d in dirs_:
-            if self.exclude['paths'].count(d):
-                dirs.remove(d)
-                logger.debug('remove directory %s from %s' % (d, dirs_))
+        if self.since is None:
+            commands = [['ls-files', '-z']]
+        else:
+            commands = [['diff', '--name-only', '-z', '--no-renames',
+                         '--relative', self.since, '--'],
+                        ['ls-files', '-z', '--others', '--exclude-standard']]
+
+        import subprocess
+
+        paths = []
+        for command in commands:
+            try:
+                result = subprocess.run(['git', '-C', root] + command,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, check=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                stderr = getattr(e, 'stderr', None) or b''
+                raise RuntimeError('Could not list files with git: %s' % (
+                    stderr.decode(errors='replace').strip() or e))
+
+            paths.extend(path for path in os.fsdecode(result.stdout)
+                         .split('\0') if path)
+        return paths
+
+    def _walk_git(self):
+        """ `_walk` for `self.git`: yields `(path, files)` for the files
+        listed by `_git_files`, grouped by directory, where `files` is a list of
+        `_GitEntry`. Nothing but the listed files is read from disk, so
+        untracked build outputs cost nothing.
+
+        Directories matching `self.exclude['paths']` are skipped as by `_walk`.
+        So are files ignored by `self.ignore_files` other than '.gitignore',
+        which git already applies. Files listed with `self.since` that no
+        longer exist and pass `_validate_file` are collected in
+        `self.removed` instead.
+        """
+        names, tree = self._build_exclude_tree()
+        self.removed = []
+        for root in self.paths:
+            yield from self._walk_git_root(root, names, tree)
+
+    def _walk_git_root(self, root, names, tree):
+        """ `_walk_git` for the single path `root`, given the results of
+        `_build_exclude_tree`. """
+        for part in _split_path(root):
+            tree = tree.get(part) if tree else None
+            if tree is True:
+                logger.debug('%s is excluded', root)
+                return
+
+        def excluded(directory):
+            node = tree
+            for part in directory.split('/') if directory else ():
+                node = node.get(part) if node else None
+                if node is True or part in names:
+                    logger.debug('remove directory %s', directory)
+                    return True
+            return False
+
+        ignore_names = [name for name in self.ignore_files
+                        if name != '.gitignore']
+        chains = {}
+
+        def chain(directory):
+            """ Returns the `IgnoreFile`s applying in `directory`, or None if
+            it's ignored, as `_walk` would find them. """
+            if directory not in chains:
+                path = os.path.join(root, *directory.split('/'))
+                ignores = ()
+                if directory:
+                    ignores = chain(directory.rpartition('/')[0])
+                    if ignores and self._is_ignored(ignores, path, True):
+                        logger.debug('%s is ignored', path)
+                        ignores = None
+                if ignores is not None:
+                    ignores = self._load_ignores(path, [
+                        _GitEntry(os.path.join(path, name))
+                        for name in ignore_names
+                        if os.path.isfile(os.path.join(path, name))], ignores)
+                chains[directory] = ignores
+            return chains[directory]
+
+        started = time.perf_counter()
+        groups = {}
+        skip = {}
+        for relpath in self._git_files(root):
+            directory, _, name = relpath.rpartition('/')
+            if directory not in skip:
+                skip[directory] = excluded(directory)
+            if skip[directory]:
+                continue
+
+            path = os.path.join(root, *relpath.split('/'))
+            if ignore_names:
+                ignores = chain(directory)
+                if ignores is None or (ignores and
+                                       self._is_ignored(ignores, path)):
+                    continue
+            if self.since is not None and not os.path.lexists(path):
+                if self._validate_file(name):
+                    self.removed.append(path)
+                continue
+            groups.setdefault(directory, []).append(_GitEntry(path))
+
+        if self.stats is not None:
+            self.stats.phases['walk'] += time.perf_counter() - started
+        for directory, files in groups.items():
+            if directory:
+                yield os.path.join(root, *directory.split('/')), files
+            else:
+                yield root, files
+
+    def _iter_targets(self):
+        """ Walks `self.paths` and yields the `os.DirEntry` of every file that
+        passes `_validate_file` (or `_validate_archive`), in `os.walk` order.
+        With `self.git`, yields a `_GitEntry` for every listed file instead.
 
-        logger.debug('final: %s', dirs)
-        return dirs
+        With more than one path, files are yielded once by `(st_dev, st_ino)`,
+        so a file reachable from several roots (i.e through a symbolic link or
+        a hard link) is only read once.
+
+        With `self.shard`, only the files in the shard are yielded, see
+        `_in_shard`.
+        """
+        if self.shard is None:
+            return self._iter_valid()
+        return self._in_shard(self._iter_valid())
+
+    def _in_shard(self, entries):
+        """ Yields the `entries` in `self.shard`, recording each in
+        `self.covered` with its position in `entries`. A file is in shard `k`
+        of `n` if the CRC-32 of its path relative to its search path is `k - 1`
+        modulo `n`, which doesn't depend on the host, the process or the
+        other files.
+        """
+        import zlib
+
+        k, n = self.shard
+        self.covered = []
+        roots = sorted((os.path.join(root, '') for root in self.paths),
+                       key=len, reverse=True)
+        for index, entry in enumerate(entries):
+            relpath = entry.path
+            for root in roots:
+                if relpath.startswith(root):
+                    relpath = relpath[len(root):]
+                    break
+            key = relpath.replace(os.sep, '/').encode('utf-8',
+                                                      'surrogateescape')
+            if zlib.crc32(key) % n == k - 1:
+                self.covered.append((index, entry.path))
+                yield entry
+
+    def _iter_valid(self, dirs=None):
+        """ Yields the files searched without `self.shard`, see
+        `_iter_targets`. If `dirs` (a `list`) is given, every directory walked
+        is appended to it. """
+        validate = self._validate_target if self.archives else \
+            self._validate_file
+
+        seen = set() if len(self.paths) > 1 else None
+
+        for path, files in self._walk_git() if self.git else self._walk():
+            if self.cancelled.is_set():
+                return
+            if dirs is not None:
+                dirs.append(path)
+            if self._debug:
+                logger.debug('parse files in %s', path)
+            if self.stats is None:
+                for entry in files:
+                    if validate(entry.name) and (
+                            seen is None or self._first_visit(entry, seen)):
+                        yield entry
+                continue
+
+            started = time.perf_counter()
+            valid = [entry for entry in files if validate(entry.name)]
+            self.stats.phases['validate'] += time.perf_counter() - started
+            self.stats.skipped += len(files) - len(valid)
+            if seen is not None:
+                valid = [entry for entry in valid
+                         if self._first_visit(entry, seen)]
+            yield from valid
+
+    @staticmethod
+    def _first_visit(entry, seen):
+        """ Returns False if the file `entry` is in `seen` by `(st_dev,
+        st_ino)`, otherwise adds it and returns True. """
+        try:
+            st = entry.stat()
+        except OSError:
+            return True
+
+        if (st.st_dev, st.st_ino) in seen:
+            logger.debug('%s was already found', entry.path)
+            return False
+        seen.add((st.st_dev, st.st_ino))
+        return True
+
+    def cancel(self):
+        """ Stops the search running in another thread (see `SearchWorker`)
+        before the next directory is walked or file is reported. The cache is
+        not saved. Cancelled searchers stay cancelled until
+        `self.cancelled.clear()`.
+        """
+        self.cancelled.set()
 
     def search_path(self):
         """ Searches for matching files from `self.path` and appends matching lines
         to `self.log`.
 
+        If `self.jobs` is greater than 1, files are parsed by a process pool.
+        Results are written in walk order, so `self.log` is identical to a
+        serial search.
+
+        If `self.cache` is set, unchanged files are served from it and it is
+        rewritten on completion.
+
         If not `self.quiet`, outputs `self.log` on completion.
         """
-        logger.debug('start search %s' % self.path)
-        for path, dirs, files in os.walk(self.path, topdown=True):
-            self.__remove_dir(dirs)
-            logger.debug('parse files in %s' % path)
-            for file in files:
-                logger.debug('validate and parse %s' %
-                             os.path.join(path, file))
-                if not self._validate_file(file):
-                    pass
-                else:
-                    self._parse_file(path, file)
+        for filepath, matches in self.iter_matches():
+            self._write_section(filepath, matches)
 
         if not self.quiet:
             print(self.log.getvalue())
 
+    def _iter_results(self):
+        """ Yields `(filepath, matches)` for every file yielded by
+        `_iter_targets`, in walk order. Loads and saves `self.cache` if set,
+        and collects `self.stats` if `self.profile`.
+        """
+        self._load_cache()
+        self.timed_out = []
+        if self.profile:
+            self.stats = ScanStats()
+            started = time.perf_counter()
+
+        if self.jobs > 1:
+            results = self._iter_results_parallel()
+        else:
+            results = self._iter_results_serial()
+
+        for filepath, matches, stats in results:
+            if self.cancelled.is_set():
+                results.close()  # stops the pool
+                logger.info('search cancelled')
+                break
+            if self.profile:
+                self.stats.add_file(filepath, matches, stats)
+            if stats is not None and stats.get('timed_out'):
+                self.timed_out.append(filepath)
+            yield filepath, matches
+
+        if self.profile:
+            self.stats.elapsed = time.perf_counter() - started
+        if not self.cancelled.is_set():  # would forget the files not reached
+            self._save_cache()
+
+    def _task(self, filepath):
+        """ Returns the `_match_file` arguments for parsing `filepath`, or the
+        `_match_archive` arguments if it is an archive to search. """
+        options = {'literals': self.literals, 'fold': self.fold,
+                   'encodings': self.encodings,
+                   'skip_binary': self.skip_binary}
+        if self._validate_archive(filepath):
+            options['archive'] = self
+        return (self._match, self._search_regex, filepath, self.profile,
+                self.budget, options)
+
+    def __getstate__(self):
+        """ Leaves the results and the walk's state out of pickled searchers,
+        which are only sent to pool processes by `_task`. """
+        state = self.__dict__.copy()
+        for name in ('log', 'stats', 'covered', 'cancelled', '_cached',
+                     '_fresh', '_ignore_cache', '_ignore_chains'):
+            state.pop(name, None)
+        return state
+
+    def _parse_files(self, filepaths):
+        """ Parses each file in the iterable `filepaths`, yielding the
+        `(filepath, matches, stats)` of `_match_file` in order. Ignores
+        `self.cache`.
+        """
+        tasks = (self._task(filepath) for filepath in filepaths)
+        if self.jobs > 1:
+            import multiprocessing
+
+            with multiprocessing.Pool(self.jobs,
+                                      log.detach_queue_logging) as pool:
+                for results in pool.imap(_match_target, tasks, chunksize=16):
+                    yield from results
+        else:
+            for results in map(_match_target, tasks):
+                yield from results
+
+    def _iter_results_serial(self):
+        """ Parses cache misses in this process, yielding the
+        `(filepath, matches, stats)` of `_match_file` in walk order. `stats`
+        is None for cache hits.
+        """
+        for entry in self._iter_targets():
+            filepath = entry.path
+            matches = self._cache_lookup(filepath, entry)
+            if matches is not None:
+                yield filepath, matches, None
+                continue
+
+            for result in _match_target(self._task(filepath)):
+                self._cache_store(*result)
+                yield result
+
+    def _iter_results_parallel(self):
+        """ Parses cache misses with a pool of `self.jobs` processes, yielding
+        `(filepath, matches, stats)` as `_iter_results_serial` does.
+
+        The pool consumes `tasks` from its own thread. `tasks` records every
+        target in `order` before yielding the misses, so each miss returned by
+        the pool is preceded in `order` by any cache hits walked before it.
+        """
+        order = collections.deque()
+
+        def tasks():
+            for entry in self._iter_targets():
+                filepath = entry.path
+                matches = self._cache_lookup(filepath, entry)
+                order.append((filepath, matches, None))
+                if matches is None:
+                    yield self._task(filepath)
+
+        import multiprocessing
+
+        with multiprocessing.Pool(self.jobs,
+                                  log.detach_queue_logging) as pool:
+            for results in pool.imap(_match_target, tasks(), chunksize=16):
+                while order[0][1] is not None:
+                    yield order.popleft()
+                order.popleft()
+                for result in results:
+                    self._cache_store(*result)
+                    yield result
+
+        while order:  # hits walked after the last miss
+            yield order.popleft()
+
+    def _cache_config(self):
+        """ Returns the settings a cached result is only valid for. `git`,
+        `since` and `shard` only choose which files are searched, so searches
+        with and without them share a cache. """
+        return {'version': version, 'regex': self.regex.pattern,
+                'flags': self.regex.flags, 'engine': self.engine,
+                'types': self.types, 'exclude': self.exclude,
+                'substring': self.substring, 'followlinks': self.followlinks,
+                'encodings': self.encodings, 'skip_binary': self.skip_binary,
+                'ignore_files': self.ignore_files}
+
+    def _load_cache(self):
+        """ Loads `self.cache` into `self._cached`, discarding it if it was
+        written with different settings, and resets the hit/miss counts.
+        """
+        self.cache_hits = self.cache_misses = 0
+        self._cached = {}
+        self._fresh = {}
+        if self.cache is None or not os.access(self.cache, os.F_OK):
+            return
+
+        try:
+            with open(self.cache) as infile:
+                data = json.load(infile)
+        except (OSError, ValueError):
+            logger.warning('Could not read cache %s, ignoring' % self.cache)
+            return
+
+        if data.get('config') == self._cache_config():
+            self._cached = data['files']
+        else:
+            logger.debug('cache %s settings changed, ignoring' % self.cache)
+
+    def _cache_lookup(self, filepath, entry=None):
+        """ Returns the cached matches for `filepath`, or None if `filepath` is
+        not cached or has changed since. If given, the stat data of the
+        `os.DirEntry` `entry` is used instead of calling `os.stat`.
+        """
+        if self.cache is None or self._validate_archive(filepath):
+            return None  # archives are searched every time
+
+        try:
+            st = entry.stat() if entry is not None else os.stat(filepath)
+        except OSError:
+            return None
+
+        key = [st.st_size, st.st_mtime_ns, st.st_ino]
+        self._fresh[filepath] = key + [None]
+        entry = self._cached.get(filepath)
+        if entry is not None and entry[:3] == key:
+            self.cache_hits += 1
+            self._fresh[filepath][3] = entry[3]
+            return [tuple(match) for match in entry[3]]
+
+        self.cache_misses += 1
+        return None
+
+    def _cache_store(self, filepath, matches, stats=None):
+        """ Records the `matches` found in `filepath` against the metadata read
+        by `_cache_lookup`. Files that timed out (see `_match_file`) are
+        forgotten, so the next search parses them again. """
+        if stats is not None and stats.get('timed_out'):
+            self._fresh.pop(filepath, None)
+        elif filepath in self._fresh:
+            self._fresh[filepath][3] = matches
+
+    def _save_cache(self):
+        """ Writes the entries looked up during this run to `self.cache`. Files
+        no longer walked are dropped, unless only part of the files were
+        searched (with `self.since` or `self.shard`): then the entries of the
+        other files are kept, and only files in `self.removed` are dropped.
+        """
+        if self.cache is None:
+            return
+
+        files = self._fresh
+        if self.since is not None or self.shard is not None:
+            files = dict(self._cached)
+            files.update(self._fresh)
+            for filepath in self.removed:
+                files.pop(filepath, None)
+
+        temp_path = self.cache + '.tmp'
+        with open(temp_path, 'w') as outfile:
+            json.dump({'config': self._cache_config(), 'files': files},
+                      outfile)
+        os.replace(temp_path, self.cache)
+        self._cached = self._fresh = {}
+
+    def clear_cache(self):
+        """ Removes `self.cache` from disk, forcing the next search to parse
+        every file. """
+        if self.cache is not None and os.access(self.cache, os.F_OK):
+            os.remove(self.cache)
+            logger.debug('removed cache %s' % self.cache)
+
+    def iter_matches(self, empty=False):
+        """ Searches for matching files from `self.path`, yielding
+        `(filepath, matches)` as each file is parsed, where `matches` is a list
+        of `(line number, line)` pairs. Files without matches are skipped,
+        unless `empty`.
+
+        Unlike `search_path`, nothing is kept in `self.log`.
+        """
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+        logger.debug('start search %s', self.path)
+        for filepath, matches in self._iter_results():
+            if matches or empty:
+                yield filepath, matches
+            elif self._debug:
+                logger.debug('no pattern in %s', filepath)
+
+        if self.cache is not None:
+            logger.info('cache: %s hits, %s misses' % (self.cache_hits,
+                                                       self.cache_misses))
+
+    def search(self, keep_text=True):
+        """ Searches for matching files from `self.path`, returning every match
+        as `Results`, for use as a library. Unlike `search_path`, nothing is
+        formatted or kept in `self.log`; format the results with
+        `Results.write`.
+
+        `keep_text` - If False, matched lines are read again when used instead
+                      of being kept, see `Results`.
+        """
+        results = Results(self, keep_text)
+        for filepath, matches in self.iter_matches():
+            results.add(filepath, matches)
+        return results
+
+    @staticmethod
+    def _format_section(filepath, matches):
+        """ Returns the output text for `filepath`: a header followed by one
+        `line number:line` entry per match. """
+        return '\n\n%s\n\n--------\n\n%s' % (
+            filepath, ''.join('%s:%s' % (i, line) for i, line in matches))
+
+    def _write_section(self, filepath, matches):
+        """ Writes the header for `filepath` followed by `matches` to
+        `self.log`. Writes nothing if `matches` is empty.
+        """
+        if not matches:
+            return
+
+        self.log.write(self._format_section(filepath, matches))
+        if self._debug:
+            logger.debug('wrote section for %s', filepath)
+
     def _parse_file(self, path, file):
         """ Parse file located at `path` of `file`, appending matching lines to
-        `self.log`. Returns True if file had any matching lines.
+        `self.log`. The file is matched as a search would, through `_task`, so
+        archives get a section per member with matching lines. Returns True if
+        file had any matching lines.
         """
-        has_pattern = False
-        temp_log = io.StringIO()
-        if os.access(os.path.join(path, file), os.F_OK):
-            try:
-                with open(os.path.join(path, file)) as infile:
-                    for i, line in enumerate(infile):
-                        if self.regex.search(line):
-                            temp_log.write('%s:%s' % (i, line))
-                            logger.debug('%s:%s' % (i, line.strip('\n')))
-                            has_pattern = True
-            except UnicodeDecodeError:
-                logger.debug('%s throws UnicodeDecodeError'
-                             % os.path.join(path, file))
-
-            if has_pattern:
-                # Write file header
-                self.log.write('\n\n%s\n\n--------\n\n' % os.path.join(path,
-                                                                       file))
-                logger.debug('wrote file header')
-                self.log.write(temp_log.getvalue())
-                logger.debug('wrote temp_log to self.log')
-            else:
-                logger.debug('no pattern in %s' % os.path.join(path, file))
-
-            return has_pattern
+        filepath = os.path.join(path, file)
+        if os.access(filepath, os.F_OK):
+            found = False
+            for target, matches, stats in _match_target(self._task(filepath)):
+                self._write_section(target, matches)
+                found = found or bool(matches)
+            return found
 
         else:
-            logger.debug('Could not open %s' % os.path.join(path, file))
-            raise RuntimeError('Could not open %s!' % os.path.join(path, file))
+            logger.debug('Could not open %s', filepath)
+            raise RuntimeError('Could not open %s!' % filepath)
 
     def write_file(self, outpath):
         """ Writes `self.log` to `outpath`, if `outpath` is valid path.
@@ -179,270 +2331,560 @@ class Searcher:
 
         return self.log
 
+    def write_partial(self, outpath):
+        """ Searches the files changed since `self.since` and writes a section
+        for each to `outpath`, including an empty one for every changed file
+        without matches and every file in `self.removed`. The result can be
+        merged into the full output of an earlier search with `merge_todo`.
 
-# UI
-class main(ttk.Frame):
-    def __init__(self, root):
-        super(main, self).__init__(root)
-        self.root = root
-        self.path = None
-        self.file_types = []
-        self.exclude = {}
-
-        # PATH AND TYPES
-        path_and_types_frame = ttk.Frame(self)
-        path_and_types_frame.pack()
-        self.path_text = StringVar()
-        self.path_text.set(os.getcwd())
-        ttk.Button(path_and_types_frame, text='Select Search Path',
-                   command=lambda:
-                   self.path_text.set(filedialog.askdirectory())).grid(column=0,
-                                                                       row=0)
-
-        self.path_label = ttk.Label(path_and_types_frame,
-                                    textvariable=self.path_text)
-        self.path_label.grid(column=1, row=0)
-        ttk.Label(path_and_types_frame,
-                  text='File types, seperated by commas:').grid(row=1, column=0)
-        self.types_entry = Entry(path_and_types_frame)
-        self.types_entry.grid(row=1, column=1)
-
-        # EXCLUDE
-        exclude_frame = ttk.Frame(self)
-        exclude_frame.pack()
-        ttk.Label(exclude_frame, text='To exclude various files, file types, '
-                  'and paths, include each entry separated by commas.'
-                  ).grid(row=0, columnspan=2, pady=(20, 10))
-
-        ttk.Label(exclude_frame,
-                  text='Extensions to exclude, seperated by commas:'
-                  ).grid(row=1, column=0)
-        self.extensions_input = Entry(exclude_frame)
-        self.extensions_input.grid(row=1, column=1)
-
-        ttk.Label(exclude_frame,
-                  text='File names to exclude, seperated by commas:'
-                  ).grid(row=2, column=0)
-        self.files_input = Entry(exclude_frame)
-        self.files_input.grid(row=2, column=1)
-
-        ttk.Label(exclude_frame,
-                  text='Paths to exclude, seperated by commas:').grid(row=3,
-                                                                      column=0)
-        self.paths_input = Entry(exclude_frame)
-        self.paths_input.grid(row=3, column=1)
-
-        regex_frame = ttk.Frame(self)
-        regex_frame.pack(pady=(20, 10))
-        ttk.Label(regex_frame,
-                  text='Specify Regex pattern').grid(row=0, column=0)
-        ttk.Label(regex_frame,
-                  text='(all \'\\\' characters must be '
-                  'escaped by an extra \'\\\'):').grid(row=1, column=0)
-        self.regex_input = Entry(regex_frame)
-        self.regex_input.grid(row=0, rowspan=2, column=1)
-
-        ttk.Button(self, text='Specify output folder and run search...',
-                   command=lambda:
-                   self._run_search(filedialog.askdirectory())
-                   ).pack(pady=(20, 10))
-        self.pack()
-
-    def _run_search(self, outpath):
-        if self.types_entry.get() == '':
-            raise RuntimeError('Must specify at least one file type')
-
-        if self.extensions_input.get() == '':
-            extensions = []
-        else:
-            extensions = list(self.extensions_input.get().split(','))
+        `returns` - The number of sections written.
+        """
+        count = 0
+        with open(outpath, 'w') as outfile:
+            outfile.write(self.header)
+            for filepath, matches in self._iter_results():
+                outfile.write(self._format_section(filepath, matches))
+                count += 1
+            for filepath in self.removed:
+                outfile.write(self._format_section(filepath, []))
+                count += 1
+
+        return count
+
+    def write_shard(self, outpath):
+        """ Searches the files in `self.shard` and writes a section for each
+        file with matches to `outpath`, in the to.do format, and a manifest of
+        the shard to `outpath + '.manifest'`: a JSON object with the keys
+            'shard' - `[k, n]`, see `self.shard`.
+            'config' - The search settings, which every shard must share.
+            'files' - `[index, filepath]` for every file searched, see
+                      `self.covered`.
+        The `n` shards' outputs are combined by `merge_shards`.
+
+        `returns` - The number of sections written.
+        """
+        if self.shard is None:
+            raise ValueError('write_shard needs a shard')
+
+        count = 0
+        with open(outpath, 'w') as outfile:
+            outfile.write(self.header)
+            for filepath, matches in self.iter_matches():
+                outfile.write(self._format_section(filepath, matches))
+                count += 1
+
+        with open(outpath + '.manifest', 'w') as outfile:
+            json.dump({'shard': list(self.shard),
+                       'config': dict(self._cache_config(), paths=self.paths,
+                                      archives=self.archives),
+                       'files': self.covered}, outfile)
+        return count
+
+    def write_sorted(self, outpath, writer=None, memory=SORT_MEMORY):
+        """ Searches for matching files from `self.path`, writing each file's
+        section to `outpath` ordered by file path instead of walk order, so
+        that the output of two searches only differs where the files do.
+
+        Results are held until about `memory` bytes are; each time, they are
+        sorted and spilled to a temporary file as a run. The runs are merged
+        as `outpath` is written, so memory use does not grow with the number
+        of matches.
+
+        `writer` - The class used to format results, one of the `FORMATS`
+                   values. Defaults to `TextWriter`.
+
+        If not `self.quiet`, outputs each text section as it is written.
+
+        `returns` - The number of files with matching lines.
+        """
+        import tempfile
+
+        writer_class = writer or TextWriter
+        count = 0
+        with tempfile.TemporaryDirectory(prefix='todo-sort-') as spill:
+            runs = []
+            results = []
+            size = 0
+            for filepath, matches in self.iter_matches():
+                results.append((filepath, matches))
+                # 64 bytes for each match's tuple and line number.
+                size += sys.getsizeof(filepath) + sum(
+                    sys.getsizeof(line) + 64 for _, line in matches)
+                if size >= memory:
+                    runs.append(_write_run(results, os.path.join(
+                        spill, '%s.jsonl' % len(runs))))
+                    results, size = [], 0
+            logger.debug('merge %s sorted runs', len(runs) + 1)
+
+            results.sort(key=lambda result: result[0])
+            merged = heapq.merge(results, *map(_read_run, runs),
+                                 key=lambda result: result[0])
+            with open(outpath, 'w', newline=writer_class.newline) as outfile:
+                writer = writer_class(outfile, self)
+                writer.begin()
+                for filepath, matches in merged:
+                    writer.write(filepath, matches)
+                    count += 1
+                    if not self.quiet:
+                        print(self._format_section(filepath, matches), end='',
+                              flush=True)
+                writer.end()
+
+        return count
+
+    def records(self, filepath, matches):
+        """ Returns a list of one `dict` per match in `matches` for `filepath`,
+        with the keys:
+            'path' - `filepath`.
+            'line' - The line number, counting from 0.
+            'text' - The line, without its line ending.
+            'match' - The text matched by `self.regex`.
+            'span' - `[start, end]` of 'match' within 'text'.
+            'tag' - The text matched by a group named 'tag' in `self.regex`
+                    (i.e '(?P<tag>TODO|FIXME)'), or None.
+        """
+        has_tag = 'tag' in self.regex.groupindex
+        records = []
+        for i, line in matches:
+            match = self.regex.search(line)
+            records.append({
+                'path': filepath, 'line': i, 'text': line.rstrip('\r\n'),
+                'match': match.group(0), 'span': list(match.span()),
+                'tag': match.group('tag') if has_tag else None})
+
+        return records
+
+    def iter_records(self):
+        """ Searches for matching files from `self.path`, yielding a `dict`
+        per match (see `records`) as each file is parsed. """
+        for filepath, matches in self.iter_matches():
+            yield from self.records(filepath, matches)
+
+    def stream_file(self, outpath, writer=None):
+        """ Searches for matching files from `self.path`, appending each file's
+        section to `outpath` as soon as the file is parsed. Memory use does not
+        grow with the number of matches, as `self.log` is not used.
+
+        `writer` - The class used to format results, one of the `FORMATS`
+                   values. Defaults to `TextWriter`.
+
+        If not `self.quiet`, outputs each text section as it is written.
+
+        `returns` - The number of files with matching lines.
+        """
+        writer_class = writer or TextWriter
+        count = 0
+        with open(outpath, 'w', newline=writer_class.newline) as outfile:
+            writer = writer_class(outfile, self)
+            writer.begin()
+            for filepath, matches in self.iter_matches():
+                writer.write(filepath, matches)
+                outfile.flush()
+                count += 1
+                if not self.quiet:
+                    print(self._format_section(filepath, matches), end='',
+                          flush=True)
+            writer.end()
 
-        if self.files_input.get() == '':
-            files = []
-        else:
-            files = list(self.files_input.get().split(','))
+        return count
 
-        if self.paths_input.get() == '':
-            paths = []
-        else:
-            paths = list(self.paths_input.get().split(','))
 
-        if self.regex_input.get() == '':
-            regex = "(?i).*#.TODO.*"
-        else:
-            regex = self.regex_input.get()
+class TextWriter:
+    """ Writes results to an open file in the to.do text format. Subclasses
+    write other formats, see `FORMATS`. """
+    filename = 'to.do'
+    newline = None  # passed to `open`
 
-        popup = Toplevel(root)
+    def __init__(self, outfile, searcher):
+        self.outfile = outfile
+        self.searcher = searcher
 
-        searcher = Searcher(self.path_text.get(), list(
-            self.types_entry.get().split(',')), extensions, files, paths, regex,
-            True)
-        searcher.search_path()
-        searcher_log = searcher.write_file(os.path.join(outpath, 'to.do'))
+    def begin(self):
+        """ Writes anything preceding the results. """
+        self.outfile.write(self.searcher.header)
 
-        ttk.Label(popup, text=searcher_log.getvalue(), justify=LEFT).pack()
+    def write(self, filepath, matches):
+        """ Writes the `matches` found in `filepath`. """
+        self.outfile.write(self.searcher._format_section(filepath, matches))
 
+    def end(self):
+        """ Writes anything following the results. """
+        pass
 
-################################################################################
-#                                   TESTS                                      #
-#                                                                              #
-#                       Add tests and helper function.                         #
-def logMe(func):
-    """ Enables tests logging for one function. Intended for use with
-    unittest.TestCase test_ cases. """
-    def wrapper(self):
-        logger.disabled = False
-        logger.removeHandler(searcher_handler)
-        logger.addHandler(tests_handler)
-        logger.info('%s' % func.__name__)
-        func(self)
-        logger.removeHandler(tests_handler)
-        logger.addHandler(searcher_handler)
-    return wrapper
-
-
-class SearcherTest(unittest.TestCase):
-    """ Tests functionality of Searcher class.
-
-    Uses the data file 'tests/sample_data.test'.
-    Creates the data file 'tests/out.do' (for `test_write_file`, cleans after
-    use).
+
+class JsonLinesWriter(TextWriter):
+    """ Writes one JSON object per match, see `Searcher.records`. """
+    filename = 'todo.jsonl'
+
+    def begin(self):
+        pass
+
+    def write(self, filepath, matches):
+        for record in self.searcher.records(filepath, matches):
+            self.outfile.write(json.dumps(record) + '\n')
+
+
+class CsvWriter(TextWriter):
+    """ Writes one CSV row per match, see `Searcher.records`. The span is
+    split into 'start' and 'end' columns. """
+    filename = 'todo.csv'
+    newline = ''
+    fields = ['path', 'line', 'text', 'match', 'start', 'end', 'tag']
+
+    def __init__(self, outfile, searcher):
+        import csv
+
+        super(CsvWriter, self).__init__(outfile, searcher)
+        self.csv = csv.DictWriter(outfile, self.fields)
+
+    def begin(self):
+        self.csv.writeheader()
+
+    def write(self, filepath, matches):
+        for record in self.searcher.records(filepath, matches):
+            record['start'], record['end'] = record.pop('span')
+            self.csv.writerow(record)
+
+
+class TagWriter(TextWriter):
+    """ Writes the to.do text format grouped by tag: one part per tag (in
+    the order of `Searcher.tags`, then as found), each holding the sections of
+    the files with that tag. Matches are held until `end`, as a file's tags
+    aren't known in advance.
     """
-    # TODO test `search_path` skips directories properly
-    def setUp(self):
-        logger.disabled = True
-
-    def tearDown(self):
-        logger.disabled = False
-
-    def test_init(self):
-        searcher = Searcher('logs', ['test'], ['test1', 'test2'],
-                            files=['test'], epaths=['test1', 'test2', 'test3'],
-                            regex='test', quiet=True)
-
-        # Path validation
-        self.assertEqual('logs', searcher.path)
-        self.assertEqual(4, len(searcher.path))
-        self.assertEqual(str, type(searcher.path))
-
-        # Types validation
-        self.assertEqual(['test'], searcher.types)
-        self.assertEqual(1, len(searcher.types))
-        self.assertEqual(list, type(searcher.types))
-
-        # Exclude Extensions validation
-        self.assertEqual(['test1', 'test2'], searcher.exclude['extensions'])
-        self.assertEqual(2, len(searcher.exclude['extensions']))
-        self.assertEqual(list, type(searcher.exclude['extensions']))
-
-        # Exclude Files validation
-        self.assertEqual(['test'], searcher.exclude['files'])
-        self.assertEqual(1, len(searcher.exclude['files']))
-        self.assertEqual(list, type(searcher.exclude['files']))
-
-        # Exclude Paths validation
-        self.assertEqual(['test1', 'test2', 'test3'],
-                         searcher.exclude['paths'])
-        self.assertEqual(3, len(searcher.exclude['paths']))
-        self.assertEqual(list, type(searcher.exclude['files']))
-
-        # Exclude validation
-        self.assertEqual(3, len(searcher.exclude))
-        self.assertEqual(dict, type(searcher.exclude))
-        categories = ['extensions', 'files', 'paths']
-        for key in searcher.exclude:  # check for keys that aren't correct
-            if not categories.count(key):
-                self.fail('Not all keys were present in searcher.exclude!')
-
-        # Regex validation
-        self.assertEqual(re.compile('test'), searcher.regex)
-        self.assertEqual('test', searcher.regex.pattern)
-
-        # Log validation
-        self.assertEqual(type(io.StringIO()), type(searcher.log))
-        self.assertTrue(searcher.log.getvalue().count('TODO MASTER'))
-
-    def test__validate_file_succeeds(self):
-        searcher = Searcher('tests', ['test'])
-        self.assertTrue(searcher._validate_file(
-            os.path.join('tests', 'sample_data.test')))
-
-    def test__validate_file_fails_on_excluded_file(self):
-        searcher = Searcher('tests', ['html'], files=['test'])
-        self.assertFalse(searcher._validate_file(
-            os.path.join('tests', 'sample_data.test')))
-
-    def test__validate_file_fails_on_excluded_extension(self):
-        searcher = Searcher('tests', ['html'], extensions=['test'])
-        self.assertFalse(searcher._validate_file(
-            os.path.join('tests', 'sample_data.test')))
-
-    def test__validate_file_fails_on_no_file_matches(self):
-        searcher = Searcher('tests', ['wont match'])
-        self.assertFalse(searcher._validate_file(
-            os.path.join('tests', 'sample_data.test')))
-
-    def test__parse_file_finds_tag(self):
-        searcher = Searcher('tests', ['test'], regex='^ *#.*TODO.*$')
-        self.assertTrue(searcher._parse_file('tests', 'sample_data.test'))
-        self.assertTrue(searcher.log.getvalue().count('0:# TODO'))
-        self.assertTrue(searcher.log.getvalue().count('sample_data.test') == 1)
-
-    def test__parse_file_with_complex_regex_finds_tag(self):
-        searcher = Searcher('tests', ['test'],
-                            regex='^ *#.*TODO.*$|^ *//.*TODO.*$')
-        self.assertTrue(searcher._parse_file('tests', 'sample_data.test'))
-        self.assertTrue(searcher.log.getvalue().count('1:// TODO'))
-        self.assertTrue(searcher.log.getvalue().count('sample_data.test') == 1)
-
-    def test__parse_file_doesnt_find_tag(self):
-        searcher = Searcher('tests', ['test'],
-                            regex='^$')
-        self.assertFalse(searcher._parse_file('tests', 'sample_data.test'))
-        self.assertFalse(searcher.log.getvalue().count('0:# TODO'))
-        self.assertFalse(searcher.log.getvalue().count('1:// TODO'))
-        self.assertTrue(searcher.log.getvalue().count('sample_data.test') < 1)
-
-    def test__parse_file_raises_runtime_error(self):
-        searcher = Searcher('tests', ['test'],
-                            regex='^$')
-        with self.assertRaises(RuntimeError):
-            searcher._parse_file('a', 'b')
-
-    @logMe
-    def test_search_path_collects_data_when_present(self):
-        searcher = Searcher('tests', ['test'], quiet=True,
-                            regex="^# TODO.*$|^// TODO.*$")
-        searcher.search_path()
-        self.assertTrue(searcher.log.getvalue().count("0:# TODO"))
-        self.assertTrue(searcher.log.getvalue().count("1:// TODO"))
-        self.assertTrue(searcher.log.getvalue().count("sample_data.test") == 1)
-
-    @logMe
-    def test_search_path_no_data_present(self):
-        searcher = Searcher('tests', ['test'], quiet=True,
-                            regex="^$")
-        searcher.search_path()
-        self.assertFalse(searcher.log.getvalue().count("0:# TODO"))
-        self.assertFalse(searcher.log.getvalue().count("1:// TODO"))
-        self.assertFalse(searcher.log.getvalue().count("sample_data.test") == 1)
-
-    @logMe
-    def test_write_file(self):
-        searcher = Searcher('tests', ['test'],
-                            regex="^.*#.*TODO.*$|^.*//.*TODO.*$", quiet=True)
-        searcher.search_path()
-        searcher_log = searcher.write_file('tests/out.do')
-        self.assertEqual(searcher.log.getvalue(), searcher_log.getvalue())
-
-        with open('tests/out.do') as out_file:
-            self.assertEqual(out_file.read(), searcher_log.getvalue())
-
-        os.remove('tests/out.do')  # clean up tests directory, avoid
-        # contamination
+    def __init__(self, outfile, searcher):
+        super(TagWriter, self).__init__(outfile, searcher)
+        self.groups = collections.OrderedDict(
+            (tag, collections.OrderedDict()) for tag in searcher.tags or [])
 
+    def write(self, filepath, matches):
+        for match, record in zip(matches,
+                                 self.searcher.records(filepath, matches)):
+            files = self.groups.setdefault(record['tag'],
+                                           collections.OrderedDict())
+            files.setdefault(filepath, []).append(match)
 
-if __name__ == '__main__':
+    def end(self):
+        for tag, files in self.groups.items():
+            if not files:
+                continue
+            self.outfile.write('\n\n%s (%s)\n========\n' % (
+                'untagged' if tag is None else tag,
+                sum(len(matches) for matches in files.values())))
+            for filepath, matches in files.items():
+                self.outfile.write(
+                    self.searcher._format_section(filepath, matches))
+
+
+FORMATS = {'text': TextWriter, 'jsonl': JsonLinesWriter, 'csv': CsvWriter,
+           'tags': TagWriter}
+
+
+_SECTION = re.compile(r'\n\n(.*)\n\n--------\n\n')
+
+
+def read_todo(path):
+    """ Reads the output file `path`, written by `Searcher.write_file` or
+    `Searcher.write_partial`.
+
+    `returns` - `(header, sections)`, where `sections` maps each file path
+    to the text of its matches, in file order.
+    """
+    with open(path) as infile:
+        text = infile.read()
+
+    starts = list(_SECTION.finditer(text))
+    header = text[:starts[0].start()] if starts else text
+    sections = {}
+    for i, start in enumerate(starts):
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(text)
+        sections[start.group(1)] = text[start.end():end]
+    return header, sections
+
+
+def merge_todo(base, partial, outpath):
+    """ Writes the output file `base` to `outpath`, with the sections of
+    `partial` (see `Searcher.write_partial`) replacing those of the same
+    files. Files with an empty section in `partial` are dropped, files not in
+    `base` are added at the end. The header of `partial` is used.
+
+    `returns` - The number of sections written.
+    """
+    sections = read_todo(base)[1]
+    header, changes = read_todo(partial)
+    sections.update(changes)
+    temp_path = outpath + '.tmp'
+    count = 0
+    with open(temp_path, 'w') as outfile:
+        outfile.write(header)
+        for filepath, text in sections.items():
+            if text:
+                outfile.write('\n\n%s\n\n--------\n\n%s' % (filepath, text))
+                count += 1
+    os.replace(temp_path, outpath)
+    return count
+
+
+def merge_shards(partials, outpath):
+    """ Writes the outputs of the `n` shards of a search (see
+    `Searcher.write_shard`), given in any order, to `outpath` as one to.do,
+    with sections in the order a search without shards would write them.
+    The header of the first shard is used.
+
+    Raises `ValueError` if `partials` aren't the `n` shards of one search.
+
+    `returns` - The number of sections written.
+    """
+    manifests = []
+    for path in partials:
+        with open(path + '.manifest') as infile:
+            manifests.append(json.load(infile))
+
+    n = manifests[0]['shard'][1] if manifests else 0
+    if sorted(tuple(manifest['shard']) for manifest in manifests) != [
+            (k, n) for k in range(1, n + 1)]:
+        raise ValueError('expected shards 1 to %s of %s, got %s' % (
+            n, n, ', '.join('%s/%s' % tuple(manifest['shard'])
+                            for manifest in manifests)))
+    if any(manifest['config'] != manifests[0]['config']
+           for manifest in manifests):
+        raise ValueError('the shards were searched with different settings')
+
+    order = {}
+    for manifest in manifests:
+        order.update((filepath, index) for index, filepath in
+                     manifest['files'])
+
+    header = None
+    sections = []
+    for k, path in sorted((manifest['shard'][0], path) for manifest, path in
+                          zip(manifests, partials)):
+        shard_header, shard_sections = read_todo(path)
+        if header is None:
+            header = shard_header
+        for filepath, text in shard_sections.items():
+            # Archive members are ordered by their archive, then as found.
+            sections.append((order[filepath.split('!/', 1)[0]], len(sections),
+                             filepath, text))
+
+    temp_path = outpath + '.tmp'
+    with open(temp_path, 'w') as outfile:
+        outfile.write(header)
+        for _, _, filepath, text in sorted(sections):
+            outfile.write('\n\n%s\n\n--------\n\n%s' % (filepath, text))
+    os.replace(temp_path, outpath)
+    return len(sections)
+
+
+class TodoIndex:
+    """ A SQLite database of the matches found by a `Searcher`, which can be
+    queried without reading the searched files. Each `update` only parses
+    files whose size or mtime changed since the last one.
+
+        >>> index = TodoIndex('todo.db')
+        >>> index.update(Searcher(getcwd(), ['py']))
+        >>> index.query(path='services/billing', tag='FIXME', count=True)
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,
+            mtime INTEGER NOT NULL, size INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files,
+            line INTEGER NOT NULL, text TEXT NOT NULL, tag TEXT);
+        CREATE INDEX IF NOT EXISTS matches_file ON matches (file_id);
+        CREATE INDEX IF NOT EXISTS matches_tag ON matches (tag);
+    """
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS matches_fts USING fts5(
+            text, content='matches', content_rowid='id');
+        CREATE TRIGGER IF NOT EXISTS matches_insert AFTER INSERT ON matches
+        BEGIN
+            INSERT INTO matches_fts (rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS matches_delete AFTER DELETE ON matches
+        BEGIN
+            INSERT INTO matches_fts (matches_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END;
+    """
+
+    def __init__(self, path):
+        """ Opens or creates the database at `path`. Full text search uses
+        FTS5 if this build of SQLite has it, otherwise `LIKE`.
+        """
+        import sqlite3
+
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.SCHEMA)
+        try:
+            self.db.executescript(self.FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            logger.debug('SQLite has no FTS5, text queries use LIKE')
+            self.fts = False
+
+    def close(self):
+        self.db.close()
+
+    def update(self, searcher):
+        """ Brings the index up to date with the files `searcher` finds,
+        parsing only new and changed files and removing the ones no longer
+        found. The whole index is rebuilt if `searcher`'s settings changed.
+
+        Like a search, fills `searcher.timed_out`, and `searcher.stats` if
+        `searcher.profile` (counting only the parsed files).
+
+        `returns` - `(updated, removed)` file counts.
+        """
+        config = json.dumps(searcher._cache_config(), sort_keys=True)
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = 'config'").fetchone()
+        with self.db:
+            if row is None or row[0] != config:
+                self.db.execute('DELETE FROM matches')
+                self.db.execute('DELETE FROM files')
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES "
+                                "('config', ?)", (config,))
+
+        known = {path: (mtime, size) for path, mtime, size in
+                 self.db.execute('SELECT path, mtime, size FROM files')}
+        # An archive has a row of its own, without matches, and its members
+        # are kept while it is unchanged.
+        members = collections.defaultdict(list)
+        for path in known:
+            if '!/' in path:
+                members[path.split('!/', 1)[0]].append(path)
+        keys = {}
+        incomplete = set()  # archives with members that timed out
+
+        def changed():  # runs in the pool's thread if searcher.jobs > 1
+            for entry in searcher._iter_targets():
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                key = (st.st_mtime_ns, st.st_size)
+                if known.pop(entry.path, None) != key:
+                    keys[entry.path] = key
+                    yield entry.path
+                else:
+                    for member in members.get(entry.path, ()):
+                        known.pop(member, None)
+
+        searcher.timed_out = []
+        if searcher.profile:
+            searcher.stats = ScanStats()
+            started = time.perf_counter()
+
+        updated = 0
+        with self.db:
+            for filepath, matches, stats in searcher._parse_files(changed()):
+                if searcher.profile:
+                    searcher.stats.add_file(filepath, matches, stats)
+                # Archive members aren't walked, they share the archive's key.
+                target = filepath.split('!/', 1)[0]
+                known.pop(filepath, None)
+                if stats is not None and stats.get('timed_out'):
+                    searcher.timed_out.append(filepath)
+                    incomplete.add(target)
+                    continue  # left as it was, parsed again next update
+                self._store(filepath, keys[target],
+                            searcher.records(filepath, matches))
+                updated += 1
+
+            for filepath, key in keys.items():
+                if (searcher._validate_archive(filepath) and
+                        filepath not in incomplete):
+                    self._store(filepath, key, [])
+
+            for filepath in known:  # not found by this search
+                self._remove(filepath)
+        removed = sum(not searcher._validate_archive(filepath)
+                      for filepath in known)
+
+        if searcher.profile:
+            searcher.stats.elapsed = time.perf_counter() - started
+
+        logger.info('index %s: %s files updated, %s removed', self.path,
+                    updated, removed)
+        return updated, removed
+
+    def _store(self, filepath, key, records):
+        """ Replaces the row and matches stored for `filepath`. """
+        self._remove(filepath)
+        file_id = self.db.execute(
+            'INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)',
+            (filepath,) + key).lastrowid
+        self.db.executemany(
+            'INSERT INTO matches (file_id, line, text, tag) VALUES (?, ?, ?, ?)',
+            [(file_id, record['line'], record['text'], record['tag'])
+             for record in records])
+
+    def _remove(self, filepath):
+        """ Removes `filepath` and its matches from the index. """
+        self.db.execute('DELETE FROM matches WHERE file_id IN '
+                        '(SELECT id FROM files WHERE path = ?)', (filepath,))
+        self.db.execute('DELETE FROM files WHERE path = ?', (filepath,))
+
+    def query(self, path=None, tag=None, text=None, count=False,
+              group_by=None, limit=None):
+        """ Returns the indexed matches, filtered by:
+            `path` - A path prefix. 'a/b' matches 'a/b' and files below it.
+            `tag` - The exact tag.
+            `text` - Words the matched line contains, in order (searched as
+                     an FTS5 phrase, so punctuation has no special meaning).
+
+        If `count`, returns the number of matches, or a list of
+        `(value, count)` for each 'tag' or 'path' if `group_by`. Otherwise
+        returns up to `limit` `(path, line, tag, text)` tuples ordered by path
+        and line.
+        """
+        where = []
+        params = []
+        if path is not None:
+            path = path.rstrip(os.sep) or os.sep
+            # 'a/b' and everything between 'a/b/' and 'a/b0' ('0' follows '/')
+            where.append('(f.path = ? OR (f.path >= ? AND f.path < ?))')
+            params.extend([path, path + os.sep,
+                           path + chr(ord(os.sep) + 1)])
+        if tag is not None:
+            where.append('m.tag = ?')
+            params.append(tag)
+        if text is not None:
+            if self.fts:
+                where.append('m.id IN (SELECT rowid FROM matches_fts '
+                             'WHERE matches_fts MATCH ?)')
+                params.append('"%s"' % text.replace('"', '""'))
+            else:
+                where.append('m.text LIKE ?')
+                params.append('%' + text + '%')
+
+        sql = ' FROM matches m JOIN files f ON f.id = m.file_id'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+
+        if count and group_by is not None:
+            column = {'tag': 'm.tag', 'path': 'f.path'}[group_by]
+            return self.db.execute('SELECT %s, COUNT(*)%s GROUP BY %s '
+                                   'ORDER BY %s' % (column, sql, column,
+                                                    column), params).fetchall()
+        if count:
+            return self.db.execute('SELECT COUNT(*)' + sql,
+                                   params).fetchone()[0]
+
+        sql = 'SELECT f.path, m.line, m.tag, m.text' + sql
+        sql += ' ORDER BY f.path, m.line'
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+        return self.db.execute(sql, params).fetchall()
+
+
+def cli(argv=None):
+    """ Runs the command line, or the GUI without -c. The entry point of the
+    installed `todotracker` command. """
     ############################################################################
     #                            ARGPARSE CONFIG                               #
     parser = argparse.ArgumentParser(
@@ -465,7 +2907,9 @@ if __name__ == '__main__':
                              '/\'\". With this example, if the program comes '
                              'across the path \'/path/to/fake\' or '
                              '\'/folder\', it will just skip the search of the '
-                             'path.', type=str)
+                             'path. Entries without a \'/\' skip every folder '
+                             'of that name, and relative paths are relative to '
+                             '-p.', type=str)
 
     parser.add_argument('-f', '--filetypes',
                         help='The file extensions excluding the \'.\' to check '
@@ -475,8 +2919,11 @@ if __name__ == '__main__':
                         help='The path to which the software should output a '
                         'to.do master file.', default='./', type=str)
 
-    parser.add_argument('-p', '--path',
-                        help='The path to search for TODO lines.')
+    parser.add_argument('-p', '--path', action='append',
+                        help='The path to search for TODO lines. Repeat to '
+                        'search several into one output, reading files found '
+                        'under more than one of them once. (i.e -p ~/repo1 '
+                        '-p ~/repo2)')
 
     parser.add_argument('-Q', '--quiet',
                         help='Do not output \'# TODO\' items as they are '
@@ -494,21 +2941,208 @@ if __name__ == '__main__':
                         '\'.\') would require an extra \'\\\' (i.e \'\\\\.\')',
                         default=r'(?i).*# TODO.*', type=str)
 
+    parser.add_argument('-j', '--jobs', help='The number of processes used to '
+                        'parse files. Defaults to 1 (serial). Use 0 to start '
+                        'one process per CPU.', default=1, type=int)
+
+    parser.add_argument('--cache', help='A file in which to store results '
+                        'between runs. Files that have not changed since the '
+                        'last run are not read again.', type=str)
+
+    parser.add_argument('--clear_cache', help='Discard the contents of '
+                        '--cache before searching.', action='store_true')
+
+    parser.add_argument('-s', '--stream', help='Write each file\'s matches '
+                        'to to.do as soon as the file is parsed, instead of '
+                        'collecting every match before writing.',
+                        action='store_true')
+
+    parser.add_argument('--sorted', help='Order to.do by file path instead of '
+                        'the order files are found in, so that the output of '
+                        'two searches can be compared.', action='store_true')
+
+    parser.add_argument('--sort_memory', help='With --sorted, the megabytes of '
+                        'results held in memory before sorted runs are '
+                        'spilled to temporary files.', default=64, type=float)
+
+    parser.add_argument('--engine', help='How files are matched. \'line\' '
+                        '(the default) searches each line in turn, \'mmap\' '
+                        'memory maps each file and searches it at once, which '
+                        'is faster for files with few matches.',
+                        choices=sorted(ENGINES), default='line')
+
+    parser.add_argument('--substring_match', help='Match -f, -ee and -ef '
+                        'against any part of a file name, as older versions '
+                        'did, instead of exact extensions, names and '
+                        'globs.', action='store_true')
+
+    parser.add_argument('--encodings', help='Encodings to try in turn when '
+                        'a file can\'t be decoded, separated by commas. (i.e '
+                        'utf-8,latin-1) Defaults to the locale\'s preferred '
+                        'encoding.')
+
+    parser.add_argument('--skip_binary', help='Skip files with a NUL byte in '
+                        'their first %s bytes.' % SNIFF_SIZE,
+                        action='store_true')
+
+    parser.add_argument('--budget', help='The number of seconds a file may '
+                        'take to search. Slower files (i.e ones a pattern '
+                        'backtracks badly on) are skipped and listed.',
+                        type=float)
+
+    parser.add_argument('--archives', help='Search inside %s archives '
+                        'without extracting them. Matches are reported as '
+                        'archive!/member.' % ', '.join(ARCHIVE_TYPES),
+                        action='store_true')
+
+    parser.add_argument('--archive_depth', help='How many archives deep to '
+                        'open archives inside archives with --archives.',
+                        default=2, type=int)
+
+    parser.add_argument('--archive_max_size', help='Skip archive members '
+                        'larger than this many bytes.', default=10 * 2 ** 20,
+                        type=int)
+
+    parser.add_argument('--git', help='Search the files tracked by git '
+                        'instead of walking the path, skipping untracked '
+                        'build outputs and .git itself.', action='store_true')
+
+    parser.add_argument('--since', help='Only search files changed since '
+                        'this git ref (i.e HEAD~1 or origin/master), writing '
+                        'to.do.partial. Implies --git.', metavar='REF')
+
+    parser.add_argument('--merge', help='With --since, merge the changes '
+                        'into the existing to.do instead of writing '
+                        'to.do.partial.', action='store_true')
+
+    parser.add_argument('--no_ignore', help='Search files ignored by %s '
+                        'files too.' % ' and '.join(IGNORE_FILES),
+                        action='store_true')
+
+    parser.add_argument('--shard', help='Only search the K-th of N parts of '
+                        'the files, given as K/N, and write them to '
+                        'to.do.K-of-N with a manifest. Run once for each K '
+                        '(i.e on N hosts), then combine the parts with the '
+                        'merge command.')
+
+    parser.add_argument('-L', '--follow_links', help='Search directories '
+                        'behind symbolic links. Each directory is searched '
+                        'once, even if links form a loop.',
+                        action='store_true')
+
+    parser.add_argument('--profile', help='Print the time spent in each '
+                        'phase of the search, throughput, file counts and the '
+                        'slowest files once the search completes.',
+                        action='store_true')
+
+    parser.add_argument('--profile_json', help='Write the --profile report to '
+                        'this file as JSON.', type=str)
+
+    parser.add_argument('--log_level', help='The lowest level of message '
+                        'logged. DEBUG logs every file searched to '
+                        'searcher.log, which slows down large searches. The '
+                        'log is in logs/ when run from source, otherwise in '
+                        '~/.cache/todotracker/logs. '
+                        'Defaults to INFO.', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'OFF'])
+
+    parser.add_argument('-w', '--watch', help='After searching, keep to.do up '
+                        'to date as files are created, changed or deleted, '
+                        'until interrupted.', action='store_true')
+
+    parser.add_argument('--debounce', help='With --watch, the seconds without '
+                        'changes to wait for before rewriting to.do.',
+                        default=0.5, type=float)
+
+    parser.add_argument('--poll', help='With --watch, find changes by '
+                        'checking every file each second, even where inotify '
+                        'is available.', action='store_true')
+
+    parser.add_argument('--format', help='The output format. \'text\' (the '
+                        'default) writes to.do, \'tags\' writes to.do grouped '
+                        'by tag, \'jsonl\' and \'csv\' write one record per '
+                        'match to todo.jsonl or todo.csv as files are parsed.',
+                        choices=sorted(FORMATS), default='text')
+
+    parser.add_argument('-t', '--tags', help='Words to search for instead of '
+                        '-r, separated by commas (i.e \'TODO,FIXME,HACK\'). '
+                        'All tags are found in one pass over each file, and '
+                        'each match records its tag.', type=str)
+
+    parser.add_argument('--index', help='Update the SQLite database at this '
+                        'path with the matches found, instead of writing '
+                        'to.do. Only files changed since the last update are '
+                        'read. Query it with the \'query\' command.',
+                        type=str)
+
     parser.add_argument('-c', '--cli', help='Use this flag to skip launching '
                                             'the applet. Use this flag in '
                                             'conjunction with other flags to '
                                             'enable CLI support.',
                         action='store_true')
 
-    parsed = parser.parse_args()  # Parse the above specified arguments.
+    commands = parser.add_subparsers(dest='command')
+    query_parser = commands.add_parser(
+        'query', help='Query a database written by --index. Prints '
+        '\'path:line:text\' for each match, or counts.')
+    query_parser.add_argument('database', help='The --index database.')
+    query_parser.add_argument('--path', help='Only matches in files at or '
+                              'below this path.')
+    query_parser.add_argument('--tag', help='Only matches with this tag.')
+    query_parser.add_argument('--text', help='Only matches whose line '
+                              'contains these words, in order.')
+    query_parser.add_argument('--count', help='Print the number of matches.',
+                              action='store_true')
+    query_parser.add_argument('--group_by', help='With --count, print the '
+                              'number of matches per tag or path.',
+                              choices=['tag', 'path'])
+    query_parser.add_argument('--limit', help='Print at most this many '
+                              'matches.', type=int)
+    merge_parser = commands.add_parser(
+        'merge', help='Combine the to.do.K-of-N files written by --shard into '
+        'one to.do, ordered as a search without --shard would order it.')
+    merge_parser.add_argument('partials', help='The to.do.K-of-N files of '
+                              'every shard.', nargs='+')
+    merge_parser.add_argument('-o', '--output', help='The file to write.',
+                              default='to.do')
+
+    parsed = parser.parse_args(argv)  # Parse the above specified arguments.
 
     ############################################################################
     #                            ARGV VALIDATION                               #
     if parsed.version:
         print(versionstr)
-        exit()
+        return
+
+    if parsed.command == 'query':
+        if not os.access(parsed.database, os.F_OK):
+            raise RuntimeError('Could not access the database.')
+        index = TodoIndex(parsed.database)
+        result = index.query(parsed.path, parsed.tag, parsed.text,
+                             parsed.count, parsed.group_by, parsed.limit)
+        if parsed.count and parsed.group_by is None:
+            print(result)
+        elif parsed.count:
+            for value, count in result:
+                print('%s\t%s' % (value, count))
+        else:
+            for path, line, tag, text in result:
+                print('%s:%s:%s' % (path, line, text))
+        index.close()
+        return
+
+    if parsed.command == 'merge':
+        print('merged %s files' % merge_shards(parsed.partials,
+                                               parsed.output))
+        return
 
     if parsed.cli:
+        if parsed.log_level == 'OFF':
+            logger.disabled = True
+        else:
+            logger.setLevel(parsed.log_level)
+        log.start_queue_logging()
+
         if parsed.exclude_extensions is not None:
             exclude_extensions = list(parsed.exclude_extensions.split(','))
         else:
@@ -537,22 +3171,125 @@ if __name__ == '__main__':
         else:
             output_path = parsed.output_path
 
+        if parsed.tags is not None:
+            tags = list(parsed.tags.split(','))
+        else:
+            tags = None
+
+        if parsed.encodings is not None:
+            encodings = list(parsed.encodings.split(','))
+        else:
+            encodings = None
+
         if parsed.path is None:
             path = os.path.expanduser('.')
         else:
-            if os.access(parsed.path, os.F_OK):
-                path = parsed.path
-            else:
+            path = [os.path.expanduser(p) for p in parsed.path]
+            if not all(os.access(p, os.F_OK) for p in path):
                 raise RuntimeError('Could not access the path created.')
 
-        searcher = Searcher(path, filetypes, exclude_extensions, exclude_files,
-                            exclude_path, parsed.regex, parsed.quiet)
-        searcher.search_path()
-        searcher_log = searcher.write_file(os.path.join(output_path, 'to.do'))
+        if parsed.shard is not None:
+            match = re.fullmatch(r'(\d+)/(\d+)', parsed.shard)
+            if (match is None or
+                    not 1 <= int(match.group(1)) <= int(match.group(2))):
+                sys.stderr.write('--shard must be K/N with 1 <= K <= N, i.e '
+                                 '2/4.\n')
+                raise RuntimeError('Invalid shard.')
+            if parsed.index or parsed.watch or parsed.since:
+                sys.stderr.write('--shard can\'t be used with --index, --watch '
+                                 'or --since.\n')
+                raise RuntimeError('Invalid shard.')
+            shard = (int(match.group(1)), int(match.group(2)))
+        else:
+            shard = None
+
+        if parsed.since is not None and (parsed.index is not None or
+                                         parsed.watch):
+            # The index would drop every file that didn't change, and the
+            # watched to.do would only hold the changed files.
+            parser.error('--since can\'t be used with --index or --watch')
+        if parsed.format != 'text' and (
+                parsed.shard or parsed.since or parsed.index or parsed.watch):
+            # These write to.do sections (or the index) whatever the format.
+            parser.error('--format can\'t be used with --shard, --since, '
+                         '--index or --watch')
+        if parsed.shard and (parsed.sorted or parsed.stream):
+            parser.error('--shard can\'t be used with --sorted or --stream')
+        if parsed.index and (parsed.watch or parsed.sorted or parsed.stream):
+            parser.error('--index can\'t be used with --watch, --sorted or '
+                         '--stream')
+        if parsed.merge and parsed.since is None:
+            parser.error('--merge can only be used with --since')
+
+        if parsed.merge and not os.access(os.path.join(output_path, 'to.do'),
+                                          os.F_OK):
+            sys.stderr.write('--merge needs the to.do of a full search in the '
+                             'output path.\n')
+            raise RuntimeError('No to.do to merge into.')
+
+        searcher = Searcher(
+            path, filetypes, extensions=exclude_extensions,
+            files=exclude_files, epaths=exclude_path, regex=parsed.regex,
+            quiet=parsed.quiet, jobs=parsed.jobs, cache=parsed.cache,
+            engine=parsed.engine, substring=parsed.substring_match,
+            followlinks=parsed.follow_links,
+            profile=parsed.profile or parsed.profile_json is not None,
+            tags=tags, encodings=encodings, skip_binary=parsed.skip_binary,
+            budget=parsed.budget, archives=parsed.archives,
+            archive_depth=parsed.archive_depth,
+            archive_max_size=parsed.archive_max_size, git=parsed.git,
+            since=parsed.since,
+            ignore_files=[] if parsed.no_ignore else IGNORE_FILES,
+            shard=shard)
+        if parsed.clear_cache:
+            searcher.clear_cache()
+        if parsed.index is not None:
+            index = TodoIndex(parsed.index)
+            index.update(searcher)
+            index.close()
+        elif parsed.watch:
+            Watcher(searcher, os.path.join(output_path, 'to.do'),
+                    parsed.debounce, poll=parsed.poll).watch()
+        elif shard is not None:
+            searcher.write_shard(os.path.join(output_path, 'to.do.%s-of-%s'
+                                              % shard))
+        elif parsed.since is not None:
+            outpath = os.path.join(output_path, 'to.do')
+            searcher.write_partial(outpath + '.partial')
+            if parsed.merge:
+                merge_todo(outpath, outpath + '.partial', outpath)
+                os.remove(outpath + '.partial')
+        elif parsed.sorted:
+            writer = FORMATS[parsed.format]
+            searcher.write_sorted(os.path.join(output_path, writer.filename),
+                                  writer, int(parsed.sort_memory * 2 ** 20))
+        elif parsed.stream or parsed.format != 'text':
+            writer = FORMATS[parsed.format]
+            searcher.stream_file(os.path.join(output_path, writer.filename),
+                                 writer)
+        else:
+            searcher.search_path()
+            searcher.write_file(os.path.join(output_path, 'to.do'))
+
+        if searcher.timed_out:
+            sys.stderr.write('Skipped %s files that took longer than %ss:\n%s\n'
+                             % (len(searcher.timed_out), parsed.budget,
+                                '\n'.join(searcher.timed_out)))
+        if parsed.profile:
+            print(searcher.stats.report())
+        if parsed.profile_json is not None:
+            searcher.stats.dump(parsed.profile_json)
+
+        log.stop_queue_logging()
 
     ############################################################################
     #                                   UI                                     #
     else:
-        root = Tk()
-        main(root)
-        root.mainloop()
+        # Loads tkinter, which the command line doesn't need.
+        import todotracker_gui
+        todotracker_gui.run()
+
+
+if __name__ == '__main__':
+    cli()
+
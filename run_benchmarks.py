@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import todotracker_log as l
+import TodoTracker
+from TodoTracker import Searcher, ENGINES
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--files', help='The number of files to generate.',
+                    default=200, type=int)
+parser.add_argument('-l', '--lines', help='The number of lines per file.',
+                    default=2000, type=int)
+parser.add_argument('-m', '--matches', help='The number of matching lines per '
+                    'file.', default=2, type=int)
+parser.add_argument('-d', '--depth', help='How many directories deep files '
+                    'are generated.', default=1, type=int)
+parser.add_argument('-b', '--binary', help='The fraction of files that are '
+                    'binary.', default=0.0, type=float)
+parser.add_argument('-e', '--rules', help='The number of exclusion rules '
+                    'searched with (split between -ee, -ef and -ep).',
+                    default=0, type=int)
+parser.add_argument('--seed', help='The seed of the generated tree.',
+                    default=0, type=int)
+parser.add_argument('-r', '--repeat', help='The number of timed runs per '
+                    'engine. The fastest run is reported.', default=3,
+                    type=int)
+parser.add_argument('-p', '--pattern', help='The regex to search with.',
+                    default=r'# TODO.*', dest='regex')
+parser.add_argument('-s', '--suite', help='The benchmarks to run.',
+                    choices=['scan', 'engines', 'logging'], default='scan')
+parser.add_argument('-j', '--json', help='Write the results to this file as '
+                    'JSON.')
+parser.add_argument('-c', '--compare', help='A JSON file written by --json to '
+                    'compare the results with. Exits with status 1 if any '
+                    'benchmark is slower by more than --threshold.')
+parser.add_argument('-t', '--threshold', help='The slowdown allowed by '
+                    '--compare, as a fraction.', default=0.1, type=float)
+parsed = parser.parse_args()
+
+
+def generate_tree(root, files, lines, matches, depth=1, binary=0.0, seed=0):
+    """ Writes `files` files of `lines` lines each below `root`, `matches` of
+    which contain '# TODO', spread over directories `depth` levels deep. A
+    `binary` fraction of them hold random bytes instead. The same arguments
+    always generate the same tree.
+
+    `returns` - The total size of the files in bytes.
+    """
+    rng = random.Random(seed)
+    size = 0
+    for n in range(files):
+        parts = ['d%s' % (n // 4 ** level % 4) for level in range(depth - 1)]
+        path = os.path.join(root, *parts)
+        os.makedirs(path, exist_ok=True)
+        filepath = os.path.join(path, 'file%s.py' % n)
+        if rng.random() < binary:
+            with open(filepath, 'wb') as outfile:
+                size += outfile.write(rng.randbytes(lines * 32))
+            continue
+
+        hits = set(rng.sample(range(lines), min(matches, lines)))
+        with open(filepath, 'w') as outfile:
+            for i in range(lines):
+                if i in hits:
+                    size += outfile.write(
+                        '    x = %s  # TODO benchmark %s\n' % (i, n))
+                else:
+                    size += outfile.write(
+                        '    x = some_function(%s, "value")\n' % i)
+
+    return size
+
+
+def exclusion_rules(count):
+    """ Returns `count` exclusion rules that match no generated file, as
+    `(extensions, files, paths)`. """
+    return ([['ext%s' % i, 'x%s.*' % i][i % 2] for i in range(0, count, 3)],
+            [['skip%s.py' % i, 'skip%s_*.py' % i][i % 2]
+             for i in range(1, count, 3)],
+            ['vendor%s' % i for i in range(2, count, 3)])
+
+
+def best_of(repeat, function):
+    """ Returns the fastest of `repeat` calls to `function`, in seconds.
+    `function` is given the result of `function.setup()` if it has one. """
+    best = None
+    for _ in range(repeat):
+        arg = function.setup() if hasattr(function, 'setup') else None
+        start = time.perf_counter()
+        function(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def make_searcher(root, **kwargs):
+    extensions, files, paths = exclusion_rules(parsed.rules)
+    return Searcher(root, ['py'], extensions, files, paths, regex=parsed.regex,
+                    quiet=True, **kwargs)
+
+
+def time_search(root, engine, repeat):
+    """ Returns the fastest of `repeat` `Searcher.search_path` runs over `root`
+    with `engine`, in seconds. """
+    def search(searcher):
+        searcher.search_path()
+    search.setup = lambda: make_searcher(root, engine=engine)
+    return best_of(repeat, search)
+
+
+def result(elapsed, files, size=None):
+    """ Returns the JSON result of a benchmark. """
+    return {'seconds': elapsed, 'files_per_second': files / elapsed,
+            'mb_per_second': None if size is None else size / 1e6 / elapsed}
+
+
+def benchmark_scan(root, size):
+    """ Times `Searcher.search_path` with each engine, and `_validate_file`
+    and `_match_target` (which `Searcher.iter_matches` parses files with)
+    over every generated file on their own. """
+    l.logger.disabled = True
+    files = [(path, entry.name)
+             for path, entries in make_searcher(root)._walk()
+             for entry in entries]
+    results = {}
+    for engine in sorted(ENGINES):
+        results['search_path[%s]' % engine] = result(
+            time_search(root, engine, parsed.repeat), len(files), size)
+
+    def validate(searcher):
+        for _ in range(10):
+            for path, name in files:
+                searcher._validate_file(name)
+    validate.setup = lambda: make_searcher(root)
+    results['_validate_file'] = result(best_of(parsed.repeat, validate),
+                                       10 * len(files))
+
+    def match(searcher):
+        for path, name in files:
+            TodoTracker._match_target(
+                searcher._task(os.path.join(path, name)))
+    match.setup = lambda: make_searcher(root)
+    results['_match_target'] = result(best_of(parsed.repeat, match),
+                                      len(files), size)
+    return results
+
+
+def benchmark_engines(root, size):
+    l.logger.disabled = True
+    results = {}
+    for engine in sorted(ENGINES):
+        results[engine] = result(time_search(root, engine, parsed.repeat),
+                                 parsed.files, size)
+    return results
+
+
+class NoLogger:
+    """ Stands in for `todotracker_log.logger` to time a search without any
+    logging. """
+    def isEnabledFor(self, level):
+        return False
+
+    def debug(self, *args):
+        pass
+
+    info = warning = debug
+
+
+def benchmark_logging(root, size):
+    """ Times the line engine with no logging code, with DEBUG disabled and
+    with DEBUG written to searcher.log directly and through a queue. """
+    results = {}
+    logger = TodoTracker.logger
+    TodoTracker.logger = NoLogger()
+    results['no logging'] = time_search(root, 'line', parsed.repeat)
+    TodoTracker.logger = logger
+
+    l.logger.setLevel('INFO')
+    results['INFO'] = time_search(root, 'line', parsed.repeat)
+    l.logger.setLevel('DEBUG')
+    results['DEBUG'] = time_search(root, 'line', parsed.repeat)
+    l.start_queue_logging()
+    results['DEBUG queued'] = time_search(root, 'line', parsed.repeat)
+    l.stop_queue_logging()
+    return {name: result(elapsed, parsed.files, size)
+            for name, elapsed in results.items()}
+
+
+def report(results, baseline=None):
+    """ Prints `results`, with each benchmark's time relative to `baseline`
+    if given. Returns the names of the benchmarks slower than `baseline` by
+    more than `parsed.threshold`. """
+    regressions = []
+    for name, current in results.items():
+        line = '%-22s %8.3fs %10.1f files/s' % (
+            name, current['seconds'], current['files_per_second'])
+        if current['mb_per_second'] is not None:
+            line += ' %8.1f MB/s' % current['mb_per_second']
+        if baseline is not None and name in baseline:
+            ratio = current['seconds'] / baseline[name]['seconds']
+            line = '%-64s %6.2fx' % (line, ratio)
+            if ratio > 1 + parsed.threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    return regressions
+
+
+config = {key: getattr(parsed, key) for key in (
+    'files', 'lines', 'matches', 'depth', 'binary', 'rules', 'seed', 'regex',
+    'suite')}
+baseline = None
+if parsed.compare is not None:
+    with open(parsed.compare) as infile:
+        baseline = json.load(infile)
+    if baseline['config'] != config:
+        print('warning: %s was run with %s\n' % (parsed.compare,
+                                                 baseline['config']))
+
+l.logger.removeHandler(l.stream_handler)
+with tempfile.TemporaryDirectory() as root:
+    size = generate_tree(root, parsed.files, parsed.lines, parsed.matches,
+                         parsed.depth, parsed.binary, parsed.seed)
+    print('%s files, %s lines each, %s matches per file, %s deep, %.0f%% '
+          'binary, %s exclusion rules (%.1f MB)\n' % (
+              parsed.files, parsed.lines, parsed.matches, parsed.depth,
+              100 * parsed.binary, parsed.rules, size / 1e6))
+
+    benchmark = {'scan': benchmark_scan, 'engines': benchmark_engines,
+                 'logging': benchmark_logging}[parsed.suite]
+    results = benchmark(root, size)
+
+regressions = report(results, baseline and baseline['results'])
+if parsed.json is not None:
+    with open(parsed.json, 'w') as outfile:
+        json.dump({'config': config, 'python': sys.version,
+                   'platform': platform.platform(), 'results': results},
+                  outfile, indent=2)
+
+if regressions:
+    print('\n%s regressed by more than %.0f%%: %s' % (
+        len(regressions), 100 * parsed.threshold, ', '.join(regressions)))
+    sys.exit(1)
@@ -8,7 +8,7 @@ import sys
 import time
 import unittest
 
-import log as l
+import todotracker_log as l
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-e', '--email', help='Flag this option to automatically '
@@ -37,7 +37,7 @@ def output_system_info(log):
 def run_tests(log, v=2):
     loader = unittest.TestLoader()
     # tests = loader.discover('.', '*.py')
-    tests = loader.loadTestsFromName('TodoTracker')
+    tests = loader.loadTestsFromName('test_TodoTracker')
     runner = unittest.TextTestRunner(stream=log, buffer=True, verbosity=v)
     log.write('Running TodoTracker tests\n')
     runner.run(tests)
@@ -73,7 +73,7 @@ if parsed.email is not None:
                                'provide a valid gmail address and password.')
         sys.exit(2)
 
-    with open('logs/tests.log') as f:
+    with open(l.TESTS_LOG_PATH) as f:
         log.write('tests log:\n')
         log.writelines([line for line in f])
 
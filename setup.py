@@ -1,11 +1,13 @@
 """
 First tries to load py2exe and configure for windows installation. Upon failure,
-defaults to py2app (MacOSx)
+defaults to setuptools, with py2app (MacOSx) settings when building an app.
 
 py2app usage:
     python setup.py py2app
 py2exe usage:
     python setup.py install
+pip usage (installs the `todotracker` command):
+    pip install .
 """
 
 try:
@@ -43,12 +45,21 @@ try:
 
 except ImportError:
     from setuptools import setup
+    import sys
     import TodoTracker
 
     APP = ['TodoTracker.py']
     DATA_FILES = ['logs']
     OPTIONS = {}
 
+    if 'py2app' in sys.argv:
+        # PY2APP SETTINGS
+        app_settings = {'app': APP, 'data_files': DATA_FILES,
+                        'options': {'py2app': OPTIONS},
+                        'setup_requires': ['py2app']}
+    else:
+        app_settings = {}
+
     setup(
         name='TodoTracker',
         version=TodoTracker.version,
@@ -67,9 +78,8 @@ except ImportError:
             'License :: OSI Approved :: MIT License',
             'Programming Language :: Python :: 3.5'
         ],
-        # PY2APP SETTINGS
-        app=APP,
-        data_files=DATA_FILES,
-        options={'py2app': OPTIONS},
-        setup_requires=['py2app'],
+        py_modules=['TodoTracker', 'todotracker_log',
+                    'todotracker_gui'],
+        entry_points={'console_scripts': ['todotracker = TodoTracker:cli']},
+        **app_settings
     )
@@ -0,0 +1,1366 @@
+""" Tests of TodoTracker, run by run_tests.py. """
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+import todotracker_log as log
+from todotracker_log import logger, searcher_handler, tests_handler
+from TodoTracker import (CsvWriter, ENGINES, JsonLinesWriter, Results,
+                         SORT_MEMORY, SearchWorker, Searcher, TagWriter,
+                         TodoIndex, Watcher, _InotifyMonitor, _PollingMonitor,
+                         _can_budget, _match_lines, _match_mmap, _plan_regex,
+                         merge_shards, merge_todo, read_todo)
+
+
+################################################################################
+#                                   TESTS                                      #
+#                                                                              #
+#                       Add tests and helper function.                         #
+def logMe(func):
+    """ Enables tests logging for one function. Intended for use with
+    unittest.TestCase test_ cases. """
+    def wrapper(self):
+        logger.disabled = False
+        logger.removeHandler(searcher_handler)
+        logger.addHandler(tests_handler)
+        logger.info('%s' % func.__name__)
+        func(self)
+        logger.removeHandler(tests_handler)
+        logger.addHandler(searcher_handler)
+    return wrapper
+
+
+def make_tree(root, files):
+    """ Creates each file in `files` (a `dict` of relative path to contents)
+    below `root`. Intended for tests that need a throwaway search tree.
+    """
+    for relpath, contents in files.items():
+        filepath = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as outfile:
+            outfile.write(contents)
+
+
+def run_cli(*args, cwd=None):
+    """ Runs TodoTracker.py with `args`, returning the
+    `subprocess.CompletedProcess` with its output as text. """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'TodoTracker.py')
+    return subprocess.run([sys.executable, script] + list(args), cwd=cwd,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+def strip_header(log):
+    """ Returns the contents of `log` after the timestamped 'TODO MASTER'
+    header. """
+    return log.getvalue().split('--------\n', 1)[1]
+
+
+class SearcherTest(unittest.TestCase):
+    """ Tests functionality of Searcher class.
+
+    Uses the data file 'tests/sample_data.test'.
+    Creates the data file 'tests/out.do' (for `test_write_file`, cleans after
+    use).
+    """
+    def setUp(self):
+        logger.disabled = True
+
+    def tearDown(self):
+        logger.disabled = False
+
+    def test_init(self):
+        searcher = Searcher('tests', ['test'], ['test1', 'test2'],
+                            files=['test'], epaths=['test1', 'test2', 'test3'],
+                            regex='test', quiet=True)
+
+        # Path validation
+        self.assertEqual('tests', searcher.path)
+        self.assertEqual(5, len(searcher.path))
+        self.assertEqual(str, type(searcher.path))
+
+        # Types validation
+        self.assertEqual(['test'], searcher.types)
+        self.assertEqual(1, len(searcher.types))
+        self.assertEqual(list, type(searcher.types))
+
+        # Exclude Extensions validation
+        self.assertEqual(['test1', 'test2'], searcher.exclude['extensions'])
+        self.assertEqual(2, len(searcher.exclude['extensions']))
+        self.assertEqual(list, type(searcher.exclude['extensions']))
+
+        # Exclude Files validation
+        self.assertEqual(['test'], searcher.exclude['files'])
+        self.assertEqual(1, len(searcher.exclude['files']))
+        self.assertEqual(list, type(searcher.exclude['files']))
+
+        # Exclude Paths validation
+        self.assertEqual(['test1', 'test2', 'test3'],
+                         searcher.exclude['paths'])
+        self.assertEqual(3, len(searcher.exclude['paths']))
+        self.assertEqual(list, type(searcher.exclude['files']))
+
+        # Exclude validation
+        self.assertEqual(3, len(searcher.exclude))
+        self.assertEqual(dict, type(searcher.exclude))
+        categories = ['extensions', 'files', 'paths']
+        for key in searcher.exclude:  # check for keys that aren't correct
+            if not categories.count(key):
+                self.fail('Not all keys were present in searcher.exclude!')
+
+        # Regex validation
+        self.assertEqual(re.compile('test'), searcher.regex)
+        self.assertEqual('test', searcher.regex.pattern)
+
+        # Log validation
+        self.assertEqual(type(io.StringIO()), type(searcher.log))
+        self.assertTrue(searcher.log.getvalue().count('TODO MASTER'))
+
+    def test__validate_file_succeeds(self):
+        searcher = Searcher('tests', ['test'])
+        self.assertTrue(searcher._validate_file(
+            os.path.join('tests', 'sample_data.test')))
+
+    def test__validate_file_fails_on_excluded_file(self):
+        searcher = Searcher('tests', ['html'], files=['test'])
+        self.assertFalse(searcher._validate_file(
+            os.path.join('tests', 'sample_data.test')))
+
+    def test__validate_file_fails_on_excluded_extension(self):
+        searcher = Searcher('tests', ['html'], extensions=['test'])
+        self.assertFalse(searcher._validate_file(
+            os.path.join('tests', 'sample_data.test')))
+
+    def test__validate_file_fails_on_no_file_matches(self):
+        searcher = Searcher('tests', ['wont match'])
+        self.assertFalse(searcher._validate_file(
+            os.path.join('tests', 'sample_data.test')))
+
+    def test__validate_file_matches_exact_extensions(self):
+        searcher = Searcher('tests', ['py', '.tar.gz'])
+        self.assertTrue(searcher._validate_file('a.py'))
+        self.assertTrue(searcher._validate_file('a.b.tar.gz'))
+        self.assertFalse(searcher._validate_file('happy.txt'))
+        self.assertFalse(searcher._validate_file('a.gz'))
+        self.assertFalse(searcher._validate_file('py'))
+
+    def test__validate_file_matches_globs(self):
+        searcher = Searcher('tests', ['py'], files=['test_*.py', 'setup.py'],
+                            extensions=['min.*'])
+        self.assertTrue(searcher._validate_file('test.py'))
+        self.assertFalse(searcher._validate_file('test_a.py'))
+        self.assertFalse(searcher._validate_file('setup.py'))
+        self.assertTrue(searcher._validate_file('my_setup.py'))
+        self.assertTrue(searcher._validate_file('min.py'))
+        self.assertFalse(searcher._validate_file('a.min.py'))
+
+    def test__validate_file_substring(self):
+        searcher = Searcher('tests', ['py'], files=['setup'], substring=True)
+        self.assertTrue(searcher._validate_file('happy.txt'))
+        self.assertFalse(searcher._validate_file('my_setup.py'))
+
+    def test__parse_file_finds_tag(self):
+        searcher = Searcher('tests', ['test'], regex='^ *#.*TODO.*$')
+        self.assertTrue(searcher._parse_file('tests', 'sample_data.test'))
+        self.assertTrue(searcher.log.getvalue().count('0:# TODO'))
+        self.assertTrue(searcher.log.getvalue().count('sample_data.test') == 1)
+
+    def test__parse_file_with_complex_regex_finds_tag(self):
+        searcher = Searcher('tests', ['test'],
+                            regex='^ *#.*TODO.*$|^ *//.*TODO.*$')
+        self.assertTrue(searcher._parse_file('tests', 'sample_data.test'))
+        self.assertTrue(searcher.log.getvalue().count('1:// TODO'))
+        self.assertTrue(searcher.log.getvalue().count('sample_data.test') == 1)
+
+    def test__parse_file_doesnt_find_tag(self):
+        searcher = Searcher('tests', ['test'],
+                            regex='^$')
+        self.assertFalse(searcher._parse_file('tests', 'sample_data.test'))
+        self.assertFalse(searcher.log.getvalue().count('0:# TODO'))
+        self.assertFalse(searcher.log.getvalue().count('1:// TODO'))
+        self.assertTrue(searcher.log.getvalue().count('sample_data.test') < 1)
+
+    def test__parse_file_raises_runtime_error(self):
+        searcher = Searcher('tests', ['test'],
+                            regex='^$')
+        with self.assertRaises(RuntimeError):
+            searcher._parse_file('a', 'b')
+
+    def test__parse_file_uses_encodings(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'a.test'), 'wb') as outfile:
+                outfile.write(b'# TODO a\n\xff\n# TODO b\n')
+            searcher = Searcher(root, ['test'], regex='# TODO', quiet=True,
+                                encodings=['utf-8', 'latin-1'])
+            self.assertEqual(2, sum(len(matches) for _, matches
+                                    in searcher.iter_matches()))
+            self.assertTrue(searcher._parse_file(root, 'a.test'))
+            self.assertEqual(2, searcher.log.getvalue().count('# TODO'))
+
+    @logMe
+    def test_search_path_collects_data_when_present(self):
+        searcher = Searcher('tests', ['test'], quiet=True,
+                            regex="^# TODO.*$|^// TODO.*$")
+        searcher.search_path()
+        self.assertTrue(searcher.log.getvalue().count("0:# TODO"))
+        self.assertTrue(searcher.log.getvalue().count("1:// TODO"))
+        self.assertTrue(searcher.log.getvalue().count("sample_data.test") == 1)
+
+    @logMe
+    def test_search_path_no_data_present(self):
+        searcher = Searcher('tests', ['test'], quiet=True,
+                            regex="^$")
+        searcher.search_path()
+        self.assertFalse(searcher.log.getvalue().count("0:# TODO"))
+        self.assertFalse(searcher.log.getvalue().count("1:// TODO"))
+        self.assertFalse(searcher.log.getvalue().count("sample_data.test") == 1)
+
+    @logMe
+    def test_write_file(self):
+        searcher = Searcher('tests', ['test'],
+                            regex="^.*#.*TODO.*$|^.*//.*TODO.*$", quiet=True)
+        searcher.search_path()
+        searcher_log = searcher.write_file('tests/out.do')
+        self.assertEqual(searcher.log.getvalue(), searcher_log.getvalue())
+
+        with open('tests/out.do') as out_file:
+            self.assertEqual(out_file.read(), searcher_log.getvalue())
+
+        os.remove('tests/out.do')  # clean up tests directory, avoid
+        # contamination
+
+    def test_init_rejects_negative_jobs(self):
+        with self.assertRaises(ValueError):
+            Searcher('tests', ['test'], jobs=-1)
+
+    def test_search_path_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, dict(
+                ('d%s/f%s.test' % (i % 4, i),
+                 'x\n# TODO %s\ny\n' % i if i % 3 else 'nothing\n')
+                for i in range(40)))
+            serial = Searcher(root, ['test'], regex='# TODO', quiet=True)
+            serial.search_path()
+            parallel = Searcher(root, ['test'], regex='# TODO', quiet=True,
+                                jobs=3)
+            parallel.search_path()
+
+        self.assertTrue(strip_header(serial.log).count('1:# TODO'))
+        self.assertEqual(strip_header(serial.log),
+                         strip_header(parallel.log))
+
+    def test_search_path_cache_serves_unchanged_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a/one.test': '# TODO one\n',
+                             'b/two.test': 'none\n# TODO two\n',
+                             'b/three.test': 'none\n'})
+            cache = os.path.join(root, 'cache.json')
+            first = Searcher(root, ['test'], regex='TODO', quiet=True,
+                             cache=cache)
+            first.search_path()
+            self.assertEqual((0, 3), (first.cache_hits, first.cache_misses))
+
+            with open(os.path.join(root, 'b', 'two.test'), 'a') as outfile:
+                outfile.write('# TODO new\n')
+
+            for jobs in (1, 2):
+                second = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                  jobs=jobs, cache=cache)
+                second.search_path()
+                uncached = Searcher(root, ['test'], regex='TODO', quiet=True)
+                uncached.search_path()
+                self.assertEqual(strip_header(uncached.log),
+                                 strip_header(second.log))
+                self.assertTrue(strip_header(second.log).count('2:# TODO new'))
+
+            self.assertEqual((3, 0), (second.cache_hits, second.cache_misses))
+
+    def test_search_path_cache_invalidated_by_settings(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'one.test': '# TODO one\n# FIXME one\n'})
+            cache = os.path.join(root, 'cache.json')
+            Searcher(root, ['test'], regex='TODO', quiet=True,
+                     cache=cache).search_path()
+            searcher = Searcher(root, ['test'], regex='FIXME', quiet=True,
+                                cache=cache)
+            searcher.search_path()
+            self.assertEqual((0, 1), (searcher.cache_hits,
+                                      searcher.cache_misses))
+            self.assertTrue(strip_header(searcher.log).count('1:# FIXME'))
+
+            searcher.clear_cache()
+            self.assertFalse(os.access(cache, os.F_OK))
+
+    def test_iter_matches_yields_only_matching_files(self):
+        searcher = Searcher('tests', ['test'], quiet=True,
+                            regex="^# TODO.*$|^// TODO.*$")
+        results = list(searcher.iter_matches())
+        self.assertEqual([os.path.join('tests', 'sample_data.test')],
+                         [filepath for filepath, matches in results])
+        self.assertEqual([0, 1], [i for i, line in results[0][1]])
+        self.assertEqual(searcher.header, searcher.log.getvalue())
+
+    def test_stream_file_matches_write_file(self):
+        searcher = Searcher('tests', ['test'],
+                            regex="^.*#.*TODO.*$|^.*//.*TODO.*$", quiet=True)
+        searcher.search_path()
+        searcher.write_file('tests/out.do')
+        streamer = Searcher('tests', ['test'],
+                            regex="^.*#.*TODO.*$|^.*//.*TODO.*$", quiet=True)
+        self.assertEqual(1, streamer.stream_file('tests/stream.do'))
+
+        with open('tests/out.do') as out_file, \
+                open('tests/stream.do') as stream_file:
+            self.assertEqual(out_file.read().split('--------\n', 1)[1],
+                             stream_file.read().split('--------\n', 1)[1])
+
+        os.remove('tests/out.do')
+        os.remove('tests/stream.do')
+
+    def test__walk_matches_os_walk(self):
+        searcher = Searcher('.', ['py'], ignore_files=[])
+        expected = [(path, sorted(files))
+                    for path, dirs, files in os.walk('.')]
+        self.assertEqual(expected,
+                         [(path, sorted(entry.name for entry in files))
+                          for path, files in searcher._walk()])
+
+    def test_search_path_skips_excluded_directories(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'vendor/third_party/a.test': 'TODO a\n',
+                             'lib/third_party/b.test': 'TODO b\n',
+                             'node/c.test': 'TODO c\n',
+                             'lib/node/d.test': 'TODO d\n',
+                             'e.test': 'TODO e\n'})
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                epaths=['vendor/third_party', 'node'])
+            found = sorted(os.path.relpath(filepath, root)
+                           for filepath, matches in searcher.iter_matches())
+
+        self.assertEqual(['e.test',
+                          os.path.join('lib', 'third_party', 'b.test')], found)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'requires os.symlink')
+    def test_search_path_followlinks_skips_loops(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a/one.test': 'TODO one\n'})
+            os.symlink(root, os.path.join(root, 'a', 'loop'))
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                followlinks=True)
+            found = [filepath for filepath, matches in searcher.iter_matches()]
+            self.assertEqual([os.path.join(root, 'a', 'one.test')], found)
+
+            searcher = Searcher(os.path.join(root, 'a'), ['test'],
+                                regex='TODO', quiet=True)
+            found = [filepath for filepath, matches in searcher.iter_matches()]
+            self.assertEqual([os.path.join(root, 'a', 'one.test')], found)
+
+    def test_search_path_profile_collects_stats(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'one.test': '# TODO one\nx\n# TODO two\n',
+                             'two.test': 'none\n',
+                             'skip.txt': '# TODO skipped\n'})
+            with open(os.path.join(root, 'bad.test'), 'wb') as outfile:
+                outfile.write(b'# TODO \xff\xfe\n')
+
+            for engine in sorted(ENGINES):
+                for jobs in (1, 2):
+                    searcher = Searcher(root, ['test'], regex='TODO',
+                                        quiet=True, engine=engine, jobs=jobs,
+                                        profile=True)
+                    searcher.search_path()
+                    stats = searcher.stats.as_dict()
+                    self.assertEqual(3, stats['files'])
+                    self.assertEqual(1, stats['skipped'])
+                    # mmap decodes hit lines only, replacing what it can't.
+                    failed = 0 if engine == 'mmap' else 1
+                    self.assertEqual(failed, stats['decode_failed'])
+                    self.assertEqual((2 - failed, 3 - failed),
+                                     (stats['matched'], stats['matches']))
+                    self.assertEqual(3, len(stats['slowest']))
+                    self.assertTrue(searcher.stats.report().count('regex'))
+
+            self.assertIsNone(Searcher(root, ['test']).stats)
+
+    def test_queue_logging_writes_records_and_restores_handlers(self):
+        handler = log.handlers.BufferingHandler(10)
+        logger.addHandler(handler)
+        logger.disabled = False
+        try:
+            before = logger.handlers[:]
+            log.start_queue_logging()
+            self.assertEqual(1, len(logger.handlers))
+            logger.warning('queued')
+            log.stop_queue_logging()
+            self.assertEqual(sorted(map(id, before)),
+                             sorted(map(id, logger.handlers)))
+            self.assertEqual(['queued'], [record.getMessage()
+                                          for record in handler.buffer])
+        finally:
+            logger.removeHandler(handler)
+
+    def test_watcher_applies_changes(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a/one.test': '# TODO one\n',
+                             'two.test': 'none\n'})
+            outpath = os.path.join(root, 'to.do')
+            watcher = Watcher(Searcher(root, ['test'], regex='TODO',
+                                       quiet=True), outpath, poll=True)
+            watcher.scan()
+            with open(outpath) as infile:
+                self.assertTrue(infile.read().count('0:# TODO one'))
+            self.assertFalse(watcher.apply(watcher._diff(None)))
+
+            make_tree(root, {'two.test': 'none\n# TODO two\n',
+                             'b/three.test': '# TODO three\n'})
+            os.remove(os.path.join(root, 'a', 'one.test'))
+            changes = watcher._diff(None)
+            self.assertEqual(3, len(changes))
+            self.assertTrue(watcher.apply(changes))
+            watcher.write()
+
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True)
+            expected = dict(searcher.iter_matches())
+            with open(outpath) as infile:
+                self.assertEqual(
+                    ''.join(Searcher._format_section(filepath, matches)
+                            for filepath, matches in sorted(expected.items())),
+                    ''.join(Searcher._format_section(filepath, matches)
+                            for filepath, matches in
+                            sorted(watcher.results.items())))
+                self.assertFalse(infile.read().count('one'))
+
+    def test_watcher_applies_archive_changes(self):
+        def write_zip(members):
+            with zipfile.ZipFile(os.path.join(root, 'dist.zip'), 'w') as zip:
+                for name, text in members.items():
+                    zip.writestr(name, text)
+
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a.py': '# TODO a\n'})
+            write_zip({'pkg/one.py': '# TODO one\n',
+                       'pkg/two.py': '# TODO two\n'})
+            watcher = Watcher(Searcher(root, ['py', 'zip'], regex='TODO.*',
+                                       quiet=True, archives=True),
+                              os.path.join(root, 'to.do'), poll=True)
+            watcher.scan()
+            self.assertEqual(['a.py', 'dist.zip!/pkg/one.py',
+                              'dist.zip!/pkg/two.py'], sorted(
+                os.path.relpath(path, root) for path in watcher.results))
+
+            time.sleep(0.01)  # a new mtime
+            write_zip({'pkg/two.py': '# TODO two, changed\n',
+                       'pkg/three.py': '# TODO three\n'})
+            changes = watcher._diff([os.path.join(root, 'dist.zip')])
+            self.assertEqual(1, len(changes))
+            self.assertTrue(watcher.apply(changes))
+            self.assertEqual(
+                [('a.py', '# TODO a\n'),
+                 ('dist.zip!/pkg/three.py', '# TODO three\n'),
+                 ('dist.zip!/pkg/two.py', '# TODO two, changed\n')],
+                sorted((os.path.relpath(path, root), matches[0][1])
+                       for path, matches in watcher.results.items()))
+
+            os.remove(os.path.join(root, 'dist.zip'))
+            self.assertTrue(watcher.apply(watcher._diff(None)))
+            self.assertEqual([os.path.join(root, 'a.py')],
+                             list(watcher.results))
+
+    def test_watcher_visits_files_of_several_paths_once(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'one/a.test': 'none\n',
+                             'shared/s.test': '# TODO s\n'})
+            os.symlink(os.path.join('..', 'shared', 's.test'),
+                       os.path.join(root, 'one', 'link.test'))
+            paths = [os.path.join(root, 'one'), os.path.join(root, 'shared')]
+            watcher = Watcher(Searcher(paths, ['test'], regex='TODO',
+                                       quiet=True), os.path.join(root, 'to.do'),
+                              poll=True)
+            watcher.scan()
+            self.assertEqual(['one/link.test'], [
+                os.path.relpath(path, root) for path in watcher.results])
+
+            time.sleep(0.01)  # a new mtime
+            make_tree(root, {'shared/s.test': '# TODO s, changed\n'})
+            changes = watcher._diff(None)
+            self.assertEqual(['one/link.test'], [
+                os.path.relpath(path, root) for path in changes])
+
+    @unittest.skipUnless(shutil.which('git'), 'requires git')
+    def test_watcher_with_git_only_watches_tracked_files(self):
+        def git(*args):
+            subprocess.run(['git', '-C', root, '-c', 'user.name=test', '-c',
+                            'user.email=test@example.com'] + list(args),
+                           check=True, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'.gitignore': 'build/\n',
+                             'a.test': '# TODO a\n'})
+            git('init', '-q')
+            git('add', '.')
+            git('commit', '-q', '-m', 'initial')
+            watcher = Watcher(Searcher(root, ['test'], regex='TODO',
+                                       quiet=True, git=True),
+                              os.path.join(root, 'to.do'), poll=True)
+            watcher.scan()
+
+            make_tree(root, {'new.test': '# TODO new\n',
+                             'build/out.test': '# TODO out\n'})
+            changed = [os.path.join(root, 'new.test'),
+                       os.path.join(root, 'build', 'out.test')]
+            self.assertEqual({}, watcher._diff(changed))
+            git('add', 'new.test')
+            self.assertEqual([changed[0]], list(watcher._diff(changed)))
+
+    def _watch_until_updated(self, poll):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'one.test': 'none\n'})
+            outpath = os.path.join(root, 'to.do')
+            watcher = Watcher(Searcher(root, ['test'], regex='TODO',
+                                       quiet=True), outpath, debounce=0.05,
+                              interval=0.05, poll=poll)
+            stop = threading.Event()
+            thread = threading.Thread(target=watcher.watch, args=(stop,))
+            thread.start()
+            try:
+                while not os.access(outpath, os.F_OK):
+                    time.sleep(0.01)
+                make_tree(root, {'one.test': 'none\n# TODO now\n',
+                                 'new/two.test': '# TODO two\n'})
+                deadline = time.monotonic() + 10
+                contents = ''
+                while time.monotonic() < deadline:
+                    with open(outpath) as infile:
+                        contents = infile.read()
+                    if (contents.count('TODO now') and
+                            contents.count('TODO two')):
+                        break
+                    time.sleep(0.02)
+            finally:
+                stop.set()
+                thread.join()
+
+            return watcher, contents
+
+    def test_watcher_watch_polling(self):
+        watcher, contents = self._watch_until_updated(poll=True)
+        self.assertIsInstance(watcher._monitor, _PollingMonitor)
+        self.assertTrue(contents.count('1:# TODO now'))
+        self.assertTrue(contents.count('0:# TODO two'))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'requires inotify')
+    def test_watcher_watch_inotify(self):
+        watcher, contents = self._watch_until_updated(poll=False)
+        self.assertIsInstance(watcher._monitor, _InotifyMonitor)
+        self.assertTrue(contents.count('1:# TODO now'))
+        self.assertTrue(contents.count('0:# TODO two'))
+
+    def test_stream_file_structured_formats(self):
+        regex = '(?P<tag>TODO|FIXME) .*'
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'one.test': 'x\n# TODO "one", 1\n  // FIXME 2\n'})
+            filepath = os.path.join(root, 'one.test')
+            expected = [
+                {'path': filepath, 'line': 1, 'text': '# TODO "one", 1',
+                 'match': 'TODO "one", 1', 'span': [2, 15], 'tag': 'TODO'},
+                {'path': filepath, 'line': 2, 'text': '  // FIXME 2',
+                 'match': 'FIXME 2', 'span': [5, 12], 'tag': 'FIXME'}]
+
+            searcher = Searcher(root, ['test'], regex=regex, quiet=True)
+            self.assertEqual(expected, list(searcher.iter_records()))
+
+            outpath = os.path.join(root, JsonLinesWriter.filename)
+            searcher.stream_file(outpath, JsonLinesWriter)
+            with open(outpath) as infile:
+                self.assertEqual(expected, [json.loads(line)
+                                            for line in infile])
+
+            outpath = os.path.join(root, CsvWriter.filename)
+            searcher.stream_file(outpath, CsvWriter)
+            with open(outpath, newline='') as infile:
+                rows = list(csv.DictReader(infile))
+            self.assertEqual(['2', '15'], [rows[0]['start'], rows[0]['end']])
+            self.assertEqual('# TODO "one", 1', rows[0]['text'])
+            self.assertEqual(['TODO', 'FIXME'], [row['tag'] for row in rows])
+
+    def test_todo_index_updates_changed_files_and_queries(self):
+        regex = '(?P<tag>TODO|FIXME) .*'
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {
+                'services/billing/a.test': '# TODO bill\n# FIXME refund\n',
+                'services/billing2/b.test': '# FIXME other\n',
+                'c.test': '# TODO pay\nnothing\n'})
+            billing = os.path.join(root, 'services', 'billing')
+            index = TodoIndex(os.path.join(root, 'todo.db'))
+            self.assertEqual((3, 0), index.update(
+                Searcher(root, ['test'], regex=regex, quiet=True, jobs=2)))
+            self.assertEqual(4, index.query(count=True))
+            self.assertEqual(1, index.query(path=billing, tag='FIXME',
+                                            count=True))
+            self.assertEqual([('FIXME', 2), ('TODO', 2)],
+                             index.query(count=True, group_by='tag'))
+            self.assertEqual([(os.path.join(billing, 'a.test'), 1, 'FIXME',
+                               '# FIXME refund')],
+                             index.query(text='refund'))
+            # Punctuation and operators are searched as words, not syntax.
+            self.assertEqual(2, index.query(text='# FIXME:', count=True))
+            self.assertEqual(1, index.query(text='FIXME "refund', count=True))
+            self.assertEqual(0, index.query(text='fixme AND', count=True))
+            self.assertEqual(0, index.query(text='*', count=True))
+
+            os.remove(os.path.join(root, 'c.test'))
+            make_tree(root, {'services/billing/a.test': '# TODO bill\n'})
+            self.assertEqual((1, 1), index.update(
+                Searcher(root, ['test'], regex=regex, quiet=True)))
+            self.assertEqual(0, index.query(path=billing, tag='FIXME',
+                                            count=True))
+            self.assertEqual(2, index.query(count=True))
+            self.assertEqual((0, 0), index.update(
+                Searcher(root, ['test'], regex=regex, quiet=True)))
+
+            # Changing settings rebuilds the index.
+            self.assertEqual((2, 0), index.update(
+                Searcher(root, ['test'], regex='TODO', quiet=True)))
+            index.close()
+
+    def test_search_path_tags(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a.test': 'x\n# TODO one\n# HACK: two\n'
+                                       'TODOS are not tags\n',
+                             'b.test': '# FIXME three\n# XXXTODO\n',
+                             'c.test': 'nothing to see\n'})
+            for engine in sorted(ENGINES):
+                searcher = Searcher(root, ['test'], quiet=True, engine=engine,
+                                    tags=['TODO', 'FIXME', 'HACK'])
+                records = sorted((os.path.basename(record['path']),
+                                  record['line'], record['tag'])
+                                 for record in searcher.iter_records())
+                self.assertEqual([('a.test', 1, 'TODO'), ('a.test', 2, 'HACK'),
+                                  ('b.test', 0, 'FIXME')], records)
+
+            outpath = os.path.join(root, 'to.do')
+            searcher.stream_file(outpath, TagWriter)
+            with open(outpath) as infile:
+                contents = infile.read()
+            self.assertTrue(contents.index('TODO (1)') <
+                            contents.index('FIXME (1)') <
+                            contents.index('HACK (1)') <
+                            contents.index('2:# HACK: two'))
+
+        with self.assertRaises(ValueError):
+            Searcher('tests', ['test'], tags=['TODO', ''])
+
+    def test_engines_decode_with_encodings(self):
+        regex = re.compile('TODO')
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'crlf.test': '# TODO one\r\nx\r# TODO two\n'})
+            filepath = os.path.join(root, 'bad.test')
+            with open(filepath, 'wb') as outfile:
+                outfile.write(b'\xff\xfe\nx = 1  # TODO caf\xe9\n')
+
+            encodings = ['utf-8', 'latin-1']
+            expected = [(1, 'x = 1  # TODO caf\xe9\n')]
+            self.assertEqual([], _match_lines(regex, filepath,
+                                              encodings=['utf-8']))
+            for engine in ENGINES.values():
+                for stats in (None, {}):
+                    self.assertEqual(expected, engine(
+                        regex, filepath, stats, encodings=encodings))
+
+            # Only the hit line is decoded, undecodable bytes are replaced.
+            self.assertEqual([(1, 'x = 1  # TODO caf\ufffd\n')], _match_mmap(
+                regex, filepath, encodings=['utf-8']))
+
+            crlf = os.path.join(root, 'crlf.test')
+            self.assertEqual([(0, '# TODO one\n'), (2, '# TODO two\n')],
+                             _match_lines(regex, crlf))
+            self.assertEqual(_match_lines(regex, crlf),
+                             _match_mmap(regex, crlf))
+
+        with self.assertRaises(LookupError):
+            Searcher('tests', ['test'], encodings=['no-such-codec'])
+
+    def test_search_path_skip_binary(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'text.test': '# TODO text\n'})
+            with open(os.path.join(root, 'blob.test'), 'wb') as outfile:
+                outfile.write(b'\x00\x01# TODO blob\n')
+
+            for engine in sorted(ENGINES):
+                searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                    engine=engine, skip_binary=True,
+                                    profile=True)
+                searcher.search_path()
+                self.assertEqual(['text.test'], [
+                    os.path.basename(filepath)
+                    for filepath, _ in searcher.iter_matches()])
+                self.assertEqual(1, searcher.stats.binary)
+
+                searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                    engine=engine)
+                self.assertEqual(2, len(list(searcher.iter_matches())))
+
+    def test__plan_regex(self):
+        for pattern, search, literals in [
+                (r'(?i).*# TODO.*', '(?i)# TODO', ('# todo',)),
+                (r'(?i).*#.TODO.*', '(?i)#.TODO', ('todo',)),
+                (r'^ *#.*TODO.*$', r'^ *#.*TODO.*$', ('TODO',)),
+                (r'(TO)DO.*?', '(TO)DO', ('TODO',)),
+                (r'x\.*', r'x\.*', ('x',)),
+                (r'.*+x', r'.*+x', ('x',)),
+                (r'a|.*', r'a|.*', None),
+                (r'[Tt]odo|FIXME', r'[Tt]odo|FIXME', None)]:
+            regex, found, fold = _plan_regex(re.compile(pattern))
+            self.assertEqual((search, literals), (regex.pattern, found))
+            self.assertEqual(pattern.startswith('(?i)'), fold)
+
+        # Folded literals casefold() can't stand in for re.IGNORECASE with.
+        for pattern, literals in [(r'(?i)fix', None), (r'(?ai)fix', ('fix',)),
+                                  (r'(?i)fıx', None), (r'(?ai)fıx', None)]:
+            regex, found, fold = _plan_regex(re.compile(pattern))
+            self.assertEqual((literals, True), (found, fold))
+
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a.test': '# fıx dotless\n'})
+            searcher = Searcher(root, ['test'], regex=r'(?i)fix', quiet=True,
+                                encodings=['utf-8'])
+            self.assertEqual(1, len(list(searcher.iter_matches())))
+
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a.test': 'x = 1  # todo lower\n',
+                             'b.test': 'nothing here\n'})
+            for engine in sorted(ENGINES):
+                searcher = Searcher(root, ['test'], regex=r'(?i).*# TODO.*',
+                                    quiet=True, engine=engine)
+                self.assertEqual(('# todo',), searcher.literals)
+                self.assertEqual([[{'path': os.path.join(root, 'a.test'),
+                                    'line': 0, 'text': 'x = 1  # todo lower',
+                                    'match': 'x = 1  # todo lower',
+                                    'span': [0, 19],
+                                    'tag': None}]],
+                                 [searcher.records(*result) for result
+                                  in searcher.iter_matches()])
+
+    @unittest.skipUnless(_can_budget(), 'requires SIGALRM')
+    def test_search_path_budget_skips_slow_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'slow.test': 'a' * 32 + 'b\n',
+                             'fast.test': 'aab\naa\n'})
+            cache = os.path.join(root, 'cache.json')
+            for jobs in (1, 2):
+                searcher = Searcher(root, ['test'], regex='(a+)+$', quiet=True,
+                                    jobs=jobs, cache=cache, budget=0.2,
+                                    profile=True)
+                searcher.search_path()
+                self.assertEqual([os.path.join(root, 'slow.test')],
+                                 searcher.timed_out)
+                self.assertEqual(1, searcher.stats.timed_out)
+                with open(cache) as infile:  # slow.test is parsed next time
+                    self.assertEqual([os.path.join(root, 'fast.test')],
+                                     list(json.load(infile)['files']))
+
+        with self.assertRaises(ValueError):
+            Searcher('tests', ['test'], budget=0)
+
+    def test_search_path_archives(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'plain.test': '# TODO plain\n'})
+            inner = io.BytesIO()
+            with zipfile.ZipFile(inner, 'w') as archive:
+                archive.writestr('pkg/inner.test', 'x\n# TODO inner\n')
+            with zipfile.ZipFile(os.path.join(root, 'dist.whl'), 'w') as wheel:
+                wheel.writestr('pkg/mod.test', '# TODO wheel\n')
+                wheel.writestr('pkg/mod.txt', '# TODO wrong type\n')
+                wheel.writestr('pkg/big.test', '# TODO big\n' + 'x' * 500)
+                wheel.writestr('vendor/nested.zip', inner.getvalue())
+            with tarfile.open(os.path.join(root, 'src.tar.gz'), 'w:gz') as tar:
+                data = b'# TODO tar\n'
+                info = tarfile.TarInfo('src/a.test')
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            with open(os.path.join(root, 'bad.tar.xz'), 'wb') as outfile:
+                outfile.write(b'not an archive')
+
+            expected = [
+                ('dist.whl!/pkg/mod.test', [(0, '# TODO wheel\n')]),
+                ('dist.whl!/vendor/nested.zip!/pkg/inner.test',
+                 [(1, '# TODO inner\n')]),
+                ('plain.test', [(0, '# TODO plain\n')]),
+                ('src.tar.gz!/src/a.test', [(0, '# TODO tar\n')])]
+            for jobs in (1, 2):
+                searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                    jobs=jobs, archives=True,
+                                    archive_max_size=400)
+                self.assertEqual(expected, sorted(
+                    (os.path.relpath(filepath, root), matches)
+                    for filepath, matches in searcher.iter_matches()))
+
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                archives=True, archive_depth=1)
+            self.assertEqual(4, len(list(searcher.iter_matches())))
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True)
+            self.assertEqual(1, len(list(searcher.iter_matches())))
+
+            index = TodoIndex(':memory:')
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                archives=True)
+            self.assertEqual((5, 0), index.update(searcher))
+            self.assertEqual((0, 0), index.update(searcher))
+            os.remove(os.path.join(root, 'dist.whl'))
+            self.assertEqual((0, 3), index.update(searcher))
+            self.assertEqual(2, index.query(count=True))
+            index.close()
+
+    @unittest.skipUnless(shutil.which('git'), 'requires git')
+    def test_search_path_git_and_since(self):
+        def git(*args):
+            subprocess.run(['git', '-C', root, '-c', 'user.name=test', '-c',
+                            'user.email=test@example.com'] + list(args),
+                           check=True, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+
+        def names(searcher):
+            return sorted(os.path.relpath(filepath, root)
+                          for filepath, _ in searcher.iter_matches())
+
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'.gitignore': 'build/\n',
+                             '.todoignore': 'gen/\n',
+                             'gen/g.test': '# TODO generated\n',
+                             'src/.todoignore': 'skip.test\n',
+                             'src/skip.test': '# TODO skip\n',
+                             'keep.test': '# TODO keep\n',
+                             'gone.test': '# TODO gone\n',
+                             'edit.test': '# TODO edit\n',
+                             os.path.join('src', 'a.test'): '# TODO a\n',
+                             os.path.join('vendor', 'v.test'): '# TODO v\n',
+                             os.path.join('build', 'out.test'): '# TODO b\n'})
+            git('init', '-q')
+            git('add', '.')
+            git('commit', '-q', '-m', 'initial')
+            make_tree(root, {'untracked.test': '# TODO new\n'})
+
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                epaths=['vendor'], git=True)
+            self.assertEqual(['edit.test', 'gone.test', 'keep.test',
+                              os.path.join('src', 'a.test')], names(searcher))
+
+            cache = os.path.join(root, 'cache.json')
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                cache=cache)
+            searcher.search_path()
+            full = os.path.join(root, 'to.do')
+            searcher.write_file(full)
+
+            os.remove(os.path.join(root, 'gone.test'))
+            make_tree(root, {'edit.test': 'done\n'})
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                since='HEAD', cache=cache)
+            partial = os.path.join(root, 'to.do.partial')
+            self.assertEqual(3, searcher.write_partial(partial))
+            self.assertEqual([os.path.join(root, 'gone.test')],
+                             searcher.removed)
+
+            # The changes were merged into the cache of the full search.
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                cache=cache)
+            self.assertEqual(4, len(list(searcher.iter_matches())))
+            self.assertEqual((5, 0), (searcher.cache_hits,
+                                      searcher.cache_misses))
+
+            self.assertEqual(4, merge_todo(full, partial, full))
+            self.assertEqual(
+                sorted(['keep.test', 'untracked.test', 'src/a.test',
+                        'vendor/v.test']),
+                sorted(os.path.relpath(filepath, root).replace(os.sep, '/')
+                       for filepath in read_todo(full)[1]))
+
+            with self.assertRaises(RuntimeError):
+                list(Searcher(tempfile.gettempdir(), ['test'],
+                              since='no-such-ref').iter_matches())
+
+    def test_search_path_ignore_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {
+                '.gitignore': '*.log.test\n!keep.log.test\nnode_modules/\n'
+                              '/dist\n',
+                'a.test': '# TODO a\n',
+                'x.log.test': '# TODO log\n',
+                'keep.log.test': '# TODO keep\n',
+                'node_modules/m/b.test': '# TODO module\n',
+                'dist/d.test': '# TODO dist\n',
+                'src/dist/s.test': '# TODO src dist\n',
+                'src/.todoignore': 'gen/**\n!x.log.test\n',
+                'src/x.log.test': '# TODO src log\n',
+                'src/gen/a/g.test': '# TODO generated\n'})
+
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True)
+            self.assertEqual(
+                ['a.test', 'keep.log.test',
+                 os.path.join('src', 'dist', 's.test'),
+                 os.path.join('src', 'x.log.test')],
+                sorted(os.path.relpath(filepath, root)
+                       for filepath, _ in searcher.iter_matches()))
+            # Chains are only kept for `Watcher`, and never pickled.
+            self.assertIsNone(searcher._ignore_chains)
+            self.assertTrue(searcher._ignore_cache)
+            state = searcher.__getstate__()
+            self.assertNotIn('_ignore_cache', state)
+            self.assertNotIn('_ignore_chains', state)
+            walked = [path for path, files in searcher._walk()]
+            self.assertNotIn(os.path.join(root, 'node_modules'), walked)
+
+            searcher = Searcher(root, ['test'], regex='TODO', quiet=True,
+                                ignore_files=[])
+            self.assertEqual(8, len(list(searcher.iter_matches())))
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'requires os.symlink')
+    def test_search_path_multiple_roots(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'one/a.test': '# TODO a\n',
+                             'one/sub/b.test': '# TODO b\n',
+                             'shared/s.test': '# TODO shared\n',
+                             'two/c.test': '# TODO c\n'})
+            os.symlink(os.path.join(root, 'shared'),
+                       os.path.join(root, 'one', 'shared'))
+            os.symlink(os.path.join(root, 'shared', 's.test'),
+                       os.path.join(root, 'two', 'link.test'))
+            os.link(os.path.join(root, 'one', 'a.test'),
+                    os.path.join(root, 'two', 'hard.test'))
+            paths = [os.path.join(root, name) for name in
+                     ('one', 'two', 'shared', os.path.join('one', 'sub'))]
+
+            results = None
+            for jobs in (1, 2):
+                searcher = Searcher(paths, ['test'], regex='TODO', quiet=True,
+                                    followlinks=True, jobs=jobs)
+                found = [os.path.relpath(filepath, root)
+                         for filepath, _ in searcher.iter_matches()]
+                self.assertEqual(results or found, found)
+                results = found
+
+            self.assertEqual(4, len(results))
+            targets = [os.path.realpath(os.path.join(root, path))
+                       for path in results]
+            self.assertEqual(['a.test', 'b.test', 'c.test', 's.test'],
+                             sorted(map(os.path.basename, targets)))
+            self.assertEqual(os.path.join('one', 'a.test'), results[0])
+
+        with self.assertRaises(OSError):
+            Searcher(['tests', 'no such path'], ['test'])
+
+    def test_write_shard_and_merge_shards(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'src/%s/f%s.test' % (i % 3, i): '# TODO %s\n' % i
+                             for i in range(30)})
+            make_tree(root, {'src/none.test': 'nothing\n'})
+            searcher = Searcher(os.path.join(root, 'src'), ['test'],
+                                regex='TODO.*', quiet=True)
+            searcher.search_path()
+            expected = strip_header(searcher.log)
+
+            partials = []
+            covered = []
+            for k in (3, 1, 2):
+                shard = Searcher(os.path.join(root, 'src'), ['test'],
+                                 regex='TODO.*', quiet=True, shard=(k, 3),
+                                 jobs=k)
+                partials.append(os.path.join(root, 'to.do.%s-of-3' % k))
+                shard.write_shard(partials[-1])
+                covered.extend(shard.covered)
+            self.assertEqual(list(range(31)),
+                             sorted(index for index, _ in covered))
+
+            outpath = os.path.join(root, 'to.do')
+            self.assertEqual(30, merge_shards(partials, outpath))
+            with open(outpath) as infile:
+                self.assertEqual(expected,
+                                 strip_header(io.StringIO(infile.read())))
+
+            with self.assertRaises(ValueError):
+                merge_shards(partials[:2], outpath)
+            with self.assertRaises(ValueError):
+                Searcher(root, ['test'], shard=(4, 3))
+
+    def test_write_sorted(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'src/%s/f%s.test' % (i % 7, i): '# TODO %s\n' % i
+                             for i in range(40)})
+            searcher = Searcher(os.path.join(root, 'src'), ['test'],
+                                regex='TODO.*', quiet=True)
+            expected = searcher.header + ''.join(
+                searcher._format_section(filepath, matches)
+                for filepath, matches in sorted(searcher.iter_matches()))
+
+            outpath = os.path.join(root, 'to.do')
+            for memory in (1, 1000, SORT_MEMORY):
+                self.assertEqual(40, searcher.write_sorted(outpath,
+                                                           memory=memory))
+                with open(outpath) as infile:
+                    self.assertEqual(expected, infile.read())
+
+            searcher.write_sorted(outpath, JsonLinesWriter, 1)
+            with open(outpath) as infile:
+                paths = [json.loads(line)['path'] for line in infile]
+            self.assertEqual(sorted(paths), paths)
+
+    def test_search_worker(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'d%s/f%s.test' % (i % 4, i): '# TODO %s\n' % i
+                             for i in range(20)})
+            make_tree(root, {'none.test': 'nothing\n'})
+            worker = SearchWorker(Searcher(root, ['test'], regex='TODO.*',
+                                           quiet=True))
+            worker.start()
+            worker.join()
+            messages = []
+            while not worker.queue.empty():
+                messages.append(worker.queue.get())
+            self.assertEqual(('done', None), messages[-1])
+            self.assertEqual(
+                list(Searcher(root, ['test'], regex='TODO.*').iter_matches()),
+                [value for kind, value in messages if kind == 'result'])
+            self.assertEqual({'files': 21, 'matches': 20},
+                             {key: messages[-2][1][key]
+                              for key in ('files', 'matches')})
+
+            searcher = Searcher(root, ['test'], regex='TODO.*', quiet=True)
+            results = searcher.iter_matches()
+            next(results)
+            searcher.cancel()
+            self.assertEqual([], list(results))
+
+            worker = SearchWorker(searcher)
+            worker.start()
+            worker.join()
+            self.assertEqual(2, worker.queue.qsize())
+            self.assertEqual(0, worker.queue.get()[1]['files'])
+            self.assertEqual(('cancelled', None), worker.queue.get())
+
+    def test_cli_index_with_profile_and_budget(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'src/a.test': '# TODO a\n',
+                             'src/b.test': 'nothing\n'})
+            database = os.path.join(root, 'todo.db')
+            for _ in range(2):
+                result = run_cli('-c', '-Q', '-f', 'test', '-r', 'TODO.*',
+                                 '-p', os.path.join(root, 'src'),
+                                 '--index', database, '--profile',
+                                 '--budget', '5', '--log_level', 'OFF')
+                self.assertEqual(0, result.returncode, result.stderr)
+            # The second update parses nothing, as nothing changed.
+            self.assertIn('0 files: 0 skipped', result.stdout)
+            result = run_cli('query', database, '--count')
+            self.assertEqual('1', result.stdout.strip(), result.stderr)
+
+    def test_cli_repeated_path(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a,b/a.test': '# TODO a\n',
+                             'c/c.test': '# TODO c\n'})
+            result = run_cli('-c', '-Q', '-f', 'test', '-r', 'TODO.*',
+                             '-p', os.path.join(root, 'a,b'),
+                             '-p', os.path.join(root, 'c'), '-o', root,
+                             '--log_level', 'OFF')
+            self.assertEqual(0, result.returncode, result.stderr)
+            with open(os.path.join(root, 'to.do')) as infile:
+                output = infile.read()
+            self.assertIn(os.path.join(root, 'a,b', 'a.test'), output)
+            self.assertIn(os.path.join(root, 'c', 'c.test'), output)
+
+    def test_cli_rejects_since_with_index_or_watch(self):
+        with tempfile.TemporaryDirectory() as root:
+            for args in (['--index', os.path.join(root, 'todo.db')],
+                         ['--watch']):
+                result = run_cli('-c', '-Q', '-f', 'test', '-p', root, '-o',
+                                 root, '--since', 'HEAD', *args)
+                self.assertEqual(2, result.returncode, result.stdout)
+                self.assertIn('--since can\'t be used', result.stderr)
+            self.assertEqual([], os.listdir(root))
+
+    def test_cli_rejects_ignored_output_options(self):
+        with tempfile.TemporaryDirectory() as root:
+            database = os.path.join(root, 'todo.db')
+            for args, message in (
+                    (['--shard', '1/2', '--sorted'], '--shard can\'t'),
+                    (['--shard', '1/2', '--stream'], '--shard can\'t'),
+                    (['--index', database, '--watch'], '--index can\'t'),
+                    (['--index', database, '--sorted'], '--index can\'t'),
+                    (['--index', database, '--stream'], '--index can\'t'),
+                    (['--merge'], '--merge can only')):
+                result = run_cli('-c', '-Q', '-f', 'test', '-p', root, '-o',
+                                 root, *args)
+                self.assertEqual(2, result.returncode, result.stdout)
+                self.assertIn(message, result.stderr)
+            self.assertEqual([], os.listdir(root))
+
+    def test_cli_rejects_format_with_other_outputs(self):
+        with tempfile.TemporaryDirectory() as root:
+            for args in (['--shard', '1/2'], ['--since', 'HEAD'],
+                         ['--index', os.path.join(root, 'todo.db')],
+                         ['--watch']):
+                result = run_cli('-c', '-Q', '-f', 'test', '-p', root, '-o',
+                                 root, '--format', 'jsonl', *args)
+                self.assertEqual(2, result.returncode, result.stdout)
+                self.assertIn('--format can\'t be used', result.stderr)
+            self.assertEqual([], os.listdir(root))
+
+    def test_cli_import_time(self):
+        # Run from a directory without logs/, which must not be created.
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'TodoTracker.py')
+        # Bytecode is written to the copies, so compiling isn't timed.
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+        def import_times(*args):
+            """ Returns `{module: cumulative seconds}` for running `args`,
+            and the total seconds spent importing. """
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime'] + list(args), cwd=root,
+                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            self.assertEqual(0, result.returncode, result.stderr)
+            times = {}
+            total = 0
+            for line in result.stderr.splitlines():
+                if line.startswith('import time:') and 'imported' not in line:
+                    _, cumulative, name = line.split('|')
+                    seconds = int(cumulative) / 1e6
+                    times[name.strip()] = seconds
+                    if not name[1:].startswith(' '):  # not nested
+                        total += seconds
+            return times, total, result
+
+        with tempfile.TemporaryDirectory() as root:
+            shutil.copy(script, root)
+            shutil.copy(os.path.join(os.path.dirname(script),
+                                     'todotracker_log.py'), root)
+            import_times('-c', 'import TodoTracker')  # writes the bytecode
+            # The least the command line needs: parsing and logging.
+            baseline, baseline_total, _ = import_times(
+                '-c', 'import argparse, logging.handlers')
+            imported, total, _ = import_times('-c', 'import TodoTracker')
+            _, _, result = import_times(os.path.join(root, 'TodoTracker.py'),
+                                        '-c', '-v')
+            self.assertIn('TodoTracker', result.stdout)
+            self.assertFalse(os.path.exists(os.path.join(root, 'logs')))
+
+        # Any other module must be imported by the feature that needs it.
+        self.assertLessEqual(
+            imported.keys() - baseline.keys(),
+            {'TodoTracker', 'todotracker_log', 'json', 'json.decoder',
+             'json.scanner', '_json', 'json.encoder', 'locale', '_locale',
+             'fnmatch'})
+        # Typically a few milliseconds, the bound only allows for slow hosts.
+        self.assertLess(total - baseline_total, 0.1)
+
+        cli_imported = {line.rsplit('|', 1)[1].strip()
+                        for line in result.stderr.splitlines()
+                        if line.startswith('import time:')}
+        for module in ('tkinter', 'unittest', 'todotracker_gui',
+                       'test_TodoTracker', 'sqlite3', 'multiprocessing',
+                       'tarfile', 'zipfile', 'ctypes', 'csv', 'tempfile',
+                       'subprocess', 'mmap'):
+            self.assertNotIn(module, cli_imported)
+
+    def test_installed_script_logs_per_user(self):
+        # A script outside the source tree, as pip installs it.
+        source = os.path.dirname(os.path.abspath(__file__))
+        with tempfile.TemporaryDirectory() as root:
+            script = os.path.join(root, 'bin', 'todotracker')
+            make_tree(root, {'bin/todotracker':
+                             'import TodoTracker\nTodoTracker.cli()\n',
+                             'tree/a.test': '# TODO a\n'})
+            env = dict(os.environ, PYTHONPATH=source,
+                       XDG_CACHE_HOME=os.path.join(root, 'cache'))
+            result = subprocess.run(
+                [sys.executable, script, '-c', '-p', 'tree', '-f', 'test',
+                 '-o', root, '--log_level', 'DEBUG'],
+                cwd=root, env=env, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, universal_newlines=True)
+            self.assertEqual(0, result.returncode, result.stderr)
+            self.assertNotIn('Logging error', result.stderr)
+            self.assertFalse(os.path.exists(os.path.join(root, 'bin',
+                                                         'logs')))
+            self.assertTrue(os.path.exists(os.path.join(
+                root, 'cache', 'todotracker', 'logs', 'searcher.log')))
+
+    def test_run_benchmarks_smoke(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'run_benchmarks.py')
+        with tempfile.TemporaryDirectory() as root:
+            outpath = os.path.join(root, 'scan.json')
+            for extra in (['-j', outpath], ['-c', outpath, '-t', '1000']):
+                result = subprocess.run(
+                    [sys.executable, script, '-n', '3', '-l', '10', '-r', '1',
+                     '-d', '2', '-e', '3'] + extra,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True)
+                self.assertEqual(0, result.returncode, result.stderr)
+                self.assertIn('_match_target', result.stdout)
+
+            with open(outpath) as infile:
+                results = json.load(infile)['results']
+            self.assertEqual({'search_path[%s]' % engine for engine in ENGINES}
+                             | {'_validate_file', '_match_target'},
+                             set(results))
+
+    def test_search_returns_results(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {'a.test': 'x\ny = 1  # TODO a\n# FIXME b\n',
+                             'b.test': 'nothing\n',
+                             'c.test': '# TODO c'})
+            searcher = Searcher(root, ['test'], quiet=True,
+                                tags=['TODO', 'FIXME'])
+            searcher.search_path()
+            for keep_text in (True, False):
+                results = searcher.search(keep_text)
+                self.assertEqual(3, len(results))
+                self.assertEqual(
+                    [('a.test', 1, 9, 13, 'TODO', 'y = 1  # TODO a'),
+                     ('a.test', 2, 2, 7, 'FIXME', '# FIXME b'),
+                     ('c.test', 0, 2, 6, 'TODO', '# TODO c')],
+                    sorted((os.path.basename(match.path), match.line,
+                            match.start, match.end, match.tag, match.text)
+                           for match in results))
+                self.assertEqual(results[-1], list(results)[2])
+
+                outpath = os.path.join(root, 'out.do')
+                self.assertEqual(2, results.write(outpath))
+                with open(outpath) as infile:
+                    self.assertEqual(
+                        sorted(section.strip() for section in
+                               strip_header(searcher.log).split('\n\n')),
+                        sorted(section.strip() for section in
+                               infile.read().split('--------\n', 1)[1]
+                               .split('\n\n')))
+
+                self.assertEqual(['TODO', 'TODO'], [
+                    results[row].tag for row in results.find('todo ')])
+                self.assertEqual(['FIXME'], [results[row].tag for row in
+                                             results.find('fixme', [0, 1, 2])])
+
+            with self.assertRaises(IndexError):
+                results[3]
+
+    def test_results_view_filter_and_add(self):
+        try:
+            import tkinter
+            import todotracker_gui
+        except ImportError:
+            self.skipTest('tkinter is not installed')
+        try:
+            window = tkinter.Tk()
+        except tkinter.TclError:
+            self.skipTest('no display')
+        window.withdraw()
+        self.addCleanup(window.destroy)
+
+        searcher = Searcher('tests', ['test'], quiet=True,
+                            tags=['TODO', 'FIXME'])
+        view = todotracker_gui.ResultsView(window, Results(searcher))
+        tree = view.tree
+        view.add('a.test', [(0, '# TODO apple\n'), (2, '# TODO banana\n')])
+        view.add('b.test', [(1, '# FIXME cherry\n')])
+        self.assertEqual(('f0', 'f1'), tree.get_children())
+        self.assertEqual('a.test (2)', tree.item('f0', 'text'))
+
+        def open_file(node):
+            tree.focus(node)
+            view._open(None)
+            return [tree.item(row, 'text') for row in tree.get_children(node)]
+
+        self.assertEqual(['0: # TODO apple', '2: # TODO banana'],
+                         open_file('f0'))
+
+        view.filter_text.set('AN')
+        view.filter()
+        self.assertEqual(('f0',), tree.get_children())
+        self.assertEqual('a.test (1)', tree.item('f0', 'text'))
+        self.assertEqual(['2: # TODO banana'], open_file('f0'))
+
+        # Files added while filtering are only shown if they match.
+        view.add('c.test', [(3, '# TODO cherry\n')])
+        view.add('d.test', [(4, '# TODO mango\n')])
+        self.assertEqual(('f0', 'f3'), tree.get_children())
+
+        view.filter_text.set('ANGO')
+        view.filter()
+        self.assertEqual(('f3',), tree.get_children())
+
+        view.filter_text.set('')
+        view.filter()
+        self.assertEqual(('f0', 'f1', 'f2', 'f3'), tree.get_children())
+        self.assertEqual(['3: # TODO cherry'], open_file('f2'))
+
+    def test_results_without_text_read_lines_like_the_search(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'a.test'), 'wb') as outfile:
+                outfile.write(b'x\n# TODO caf\xe9\n')
+            with zipfile.ZipFile(os.path.join(root, 'b.zip'), 'w') as zip:
+                zip.writestr('m.test', '# TODO member\n')
+            searcher = Searcher(root, ['test', 'zip'], regex='TODO',
+                                quiet=True, encodings=['utf-8', 'latin-1'],
+                                archives=True)
+            results = searcher.search(keep_text=False)
+            self.assertEqual(['# TODO café', '# TODO member'],
+                             sorted(match.text for match in results))
+            self.assertEqual(1, len(results.find('CAFÉ')))
+
+            # Lines that no longer match are given as ''.
+            make_tree(root, {'a.test': 'x\nnothing\n'})
+            results._reread = None
+            self.assertEqual([''], [match.text for match in results
+                                    if match.path.endswith('a.test')])
+
+    def test_results_hold_more_tags_than_fit_in_16_bits(self):
+        searcher = Searcher('tests', ['test'], regex=r'(?P<tag>T\d+)',
+                            quiet=True)
+        results = Results(searcher)
+        results.add('a.test', [(i, 'T%s\n' % i) for i in range(2 ** 16 + 1)])
+        self.assertEqual('T65536', results[-1].tag)
+
+    def test__match_lines_literals_skip_files(self):
+        regex = re.compile('TODO')
+        filepath = os.path.join('tests', 'sample_data.test')
+        self.assertEqual(_match_lines(regex, filepath),
+                         _match_lines(regex, filepath, literals=('TODO',)))
+        for engine in ENGINES.values():
+            self.assertEqual([], engine(regex, filepath, None, ('FIXME',)))
+            self.assertEqual([], engine(regex, filepath, {}, ('FIXME',)))
+
+    def test_init_rejects_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            Searcher('tests', ['test'], engine='wont match')
+
+    def test__match_mmap_matches__match_lines(self):
+        with tempfile.TemporaryDirectory() as root:
+            make_tree(root, {
+                'plain.test': 'a\n# TODO one\n\nb # todo two\n# TODO end',
+                'spans.test': '# TODO\nnext\n  \n',
+                'empty.test': '',
+                'unicode.test': '\u00e9\n# TODO \u00e9t\u00e9\n',
+                'crlf.test': 'a\r\n# TODO crlf\r\n'})
+            for regex in ['(?i).*# TODO.*', 'TODO\\s+next', '^$', 'TODO$',
+                          '^\\s*$', '\\Atodo']:
+                compiled = re.compile(regex)
+                for file in os.listdir(root):
+                    filepath = os.path.join(root, file)
+                    self.assertEqual(_match_lines(compiled, filepath),
+                                     _match_mmap(compiled, filepath),
+                                     '%s %s' % (regex, file))
+
+
@@ -0,0 +1,262 @@
+""" The TodoTracker GUI, opened by running TodoTracker.py without -c. Kept
+apart so that the command line doesn't load tkinter. """
+import os
+import queue
+from tkinter import StringVar, Entry, Toplevel, LEFT, Tk
+from tkinter import END, DISABLED, RIGHT, BOTH, Y
+from tkinter import ttk
+from tkinter import filedialog
+
+from TodoTracker import Results, Searcher, SearchWorker
+
+
+class ResultsView(ttk.Frame):
+    """ Shows `Results` in a `ttk.Treeview` with one node per file. A file's
+    matches are only inserted when its node is first opened, so the tree holds
+    a node per file rather than per match. Typing in the filter box shows only
+    the matches whose line contains the text, found with `Results.find`
+    instead of searching the tree.
+    """
+    def __init__(self, parent, results):
+        super(ResultsView, self).__init__(parent)
+        self.results = results
+        self.query = ''
+        self._files = []  # file id -> range of its rows
+        self._shown = None  # file id -> rows matching `query`, None if all
+        self._refilter = None
+
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(fill='x')
+        ttk.Label(filter_frame, text='Filter:').pack(side=LEFT)
+        self.filter_text = StringVar()
+        self.filter_text.trace_add('write', self._filter_changed)
+        Entry(filter_frame, textvariable=self.filter_text).pack(
+            side=LEFT, fill='x', expand=True)
+
+        self.tree = ttk.Treeview(self, show='tree')
+        scrollbar = ttk.Scrollbar(self, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=RIGHT, fill=Y)
+        self.tree.pack(side=LEFT, fill=BOTH, expand=True)
+        self.tree.bind('<<TreeviewOpen>>', self._open)
+
+    def add(self, filepath, matches):
+        """ Adds the `matches` found in `filepath` to `self.results`, and
+        shows them if they pass the filter. """
+        start = len(self.results)
+        self.results.add(filepath, matches)
+        rows = range(start, len(self.results))
+        self._files.append(rows)
+        if self._shown is not None:
+            rows = self.results.find(self.query, rows)
+            self._shown[len(self._files) - 1] = rows
+        if rows:
+            self._insert_file(len(self._files) - 1, rows)
+
+    def _insert_file(self, file_id, rows):
+        """ Inserts the node of `file_id`, with a placeholder child replaced
+        by `rows` when the node is opened. """
+        node = self.tree.insert('', END, 'f%s' % file_id, text='%s (%s)' % (
+            self.results.paths[file_id], len(rows)))
+        self.tree.insert(node, END, 'p%s' % file_id)
+
+    def _open(self, event):
+        node = self.tree.focus()
+        if not node.startswith('f') or not self.tree.exists('p' + node[1:]):
+            return
+
+        file_id = int(node[1:])
+        self.tree.delete('p%s' % file_id)
+        rows = (self._files[file_id] if self._shown is None
+                else self._shown[file_id])
+        for row in rows:
+            match = self.results[row]
+            self.tree.insert(node, END, 'r%s' % row, text='%s: %s' % (
+                match.line, match.text))
+
+    def _filter_changed(self, *args):
+        """ Filters 200ms after the last change to the filter box. """
+        if self._refilter is not None:
+            self.after_cancel(self._refilter)
+        self._refilter = self.after(200, self.filter)
+
+    def filter(self):
+        """ Shows only the matches containing the text of the filter box. A
+        longer query only searches the matches of the last one. """
+        self._refilter = None
+        query = self.filter_text.get()
+        if not query:
+            self._shown = None
+        elif self._shown is not None and query.casefold().startswith(
+                self.query.casefold()):
+            self._shown = {file_id: self.results.find(query, rows)
+                           for file_id, rows in self._shown.items()}
+        else:
+            self._shown = {file_id: self.results.find(query, rows)
+                           for file_id, rows in enumerate(self._files)}
+        self.query = query
+
+        self.tree.delete(*self.tree.get_children())
+        shown = (enumerate(self._files) if self._shown is None
+                 else self._shown.items())
+        for file_id, rows in shown:
+            if rows:
+                self._insert_file(file_id, rows)
+
+
+class main(ttk.Frame):
+    def __init__(self, root):
+        super(main, self).__init__(root)
+        self.root = root
+        self.path = None
+        self.file_types = []
+        self.exclude = {}
+
+        # PATH AND TYPES
+        path_and_types_frame = ttk.Frame(self)
+        path_and_types_frame.pack()
+        self.path_text = StringVar()
+        self.path_text.set(os.getcwd())
+        ttk.Button(path_and_types_frame, text='Select Search Path',
+                   command=lambda:
+                   self.path_text.set(filedialog.askdirectory())).grid(column=0,
+                                                                       row=0)
+
+        self.path_label = ttk.Label(path_and_types_frame,
+                                    textvariable=self.path_text)
+        self.path_label.grid(column=1, row=0)
+        ttk.Label(path_and_types_frame,
+                  text='File types, seperated by commas:').grid(row=1, column=0)
+        self.types_entry = Entry(path_and_types_frame)
+        self.types_entry.grid(row=1, column=1)
+
+        # EXCLUDE
+        exclude_frame = ttk.Frame(self)
+        exclude_frame.pack()
+        ttk.Label(exclude_frame, text='To exclude various files, file types, '
+                  'and paths, include each entry separated by commas.'
+                  ).grid(row=0, columnspan=2, pady=(20, 10))
+
+        ttk.Label(exclude_frame,
+                  text='Extensions to exclude, seperated by commas:'
+                  ).grid(row=1, column=0)
+        self.extensions_input = Entry(exclude_frame)
+        self.extensions_input.grid(row=1, column=1)
+
+        ttk.Label(exclude_frame,
+                  text='File names to exclude, seperated by commas:'
+                  ).grid(row=2, column=0)
+        self.files_input = Entry(exclude_frame)
+        self.files_input.grid(row=2, column=1)
+
+        ttk.Label(exclude_frame,
+                  text='Paths to exclude, seperated by commas:').grid(row=3,
+                                                                      column=0)
+        self.paths_input = Entry(exclude_frame)
+        self.paths_input.grid(row=3, column=1)
+
+        regex_frame = ttk.Frame(self)
+        regex_frame.pack(pady=(20, 10))
+        ttk.Label(regex_frame,
+                  text='Specify Regex pattern').grid(row=0, column=0)
+        ttk.Label(regex_frame,
+                  text='(all \'\\\' characters must be '
+                  'escaped by an extra \'\\\'):').grid(row=1, column=0)
+        self.regex_input = Entry(regex_frame)
+        self.regex_input.grid(row=0, rowspan=2, column=1)
+
+        ttk.Button(self, text='Specify output folder and run search...',
+                   command=lambda:
+                   self._run_search(filedialog.askdirectory())
+                   ).pack(pady=(20, 10))
+        self.pack()
+
+    def _run_search(self, outpath):
+        if self.types_entry.get() == '':
+            raise RuntimeError('Must specify at least one file type')
+
+        if self.extensions_input.get() == '':
+            extensions = []
+        else:
+            extensions = list(self.extensions_input.get().split(','))
+
+        if self.files_input.get() == '':
+            files = []
+        else:
+            files = list(self.files_input.get().split(','))
+
+        if self.paths_input.get() == '':
+            paths = []
+        else:
+            paths = list(self.paths_input.get().split(','))
+
+        if self.regex_input.get() == '':
+            regex = "(?i).*#.TODO.*"
+        else:
+            regex = self.regex_input.get()
+
+        searcher = Searcher(self.path_text.get(), list(
+            self.types_entry.get().split(',')), extensions, files, paths, regex,
+            True)
+        worker = SearchWorker(searcher)
+
+        popup = Toplevel(self.root)
+        popup.title('Searching %s' % searcher.path)
+        status = StringVar()
+        status.set('Searching...')
+        ttk.Label(popup, textvariable=status).pack(pady=(10, 10))
+        cancel = ttk.Button(popup, text='Cancel', command=worker.cancel)
+        cancel.pack()
+        results = ResultsView(popup, Results(searcher))
+        results.pack(fill=BOTH, expand=True)
+
+        def close():
+            worker.cancel()
+            popup.destroy()
+        popup.protocol('WM_DELETE_WINDOW', close)
+
+        worker.start()
+        self._poll(worker, os.path.join(outpath, 'to.do'), popup, status,
+                   results, cancel)
+
+    def _poll(self, worker, outpath, popup, status, results, cancel):
+        """ Shows the messages `worker` put on its queue since the last call
+        in `popup`, adding results to the `ResultsView` `results`, then calls
+        itself again after 100ms until the search stopped. Writes `outpath`
+        once the search is done.
+        """
+        if not popup.winfo_exists():
+            return
+
+        for _ in range(500):  # stays responsive while results pour in
+            try:
+                kind, value = worker.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'result':
+                results.add(*value)
+            elif kind == 'progress':
+                status.set('%(files)s files, %(matches)s matches, '
+                           '%(files_per_second).0f files/s' % value)
+            else:
+                cancel.configure(state=DISABLED)
+                if kind == 'done':
+                    results.results.write(outpath)
+                    status.set('%s. Wrote %s' % (status.get(), outpath))
+                elif kind == 'cancelled':
+                    status.set('%s. Cancelled' % status.get())
+                else:
+                    status.set('Search failed: %s' % value)
+                return
+
+        self.after(100, self._poll, worker, outpath, popup, status, results,
+                   cancel)
+
+
+def run():
+    """ Opens the search window and runs the Tk event loop until it's
+    closed. """
+    root = Tk()
+    main(root)
+    root.mainloop()
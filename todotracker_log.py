@@ -0,0 +1,131 @@
+import logging
+import logging.handlers as handlers
+
+import sys  # for grabbing the program directory
+import os  # for splitting sys.argv
+import queue  # for QueueHandler
+PROGRAM_PATH = os.path.split(sys.argv[0])[0]
+MODULE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def _log_dir():
+    """ Returns logs/ beside the program when it's run from a source
+    checkout, otherwise a per-user directory, as the directory of an installed
+    `todotracker` script (like /usr/local/bin) usually isn't writable. """
+    if os.path.abspath(PROGRAM_PATH) == MODULE_PATH:
+        return os.path.join(PROGRAM_PATH, 'logs')
+
+    cache = (os.environ.get('XDG_CACHE_HOME') or
+             os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache, 'todotracker', 'logs')
+
+
+LOG_DIR = _log_dir()
+SEARCHER_LOG_PATH = os.path.join(LOG_DIR, 'searcher.log')
+TESTS_LOG_PATH = os.path.join(LOG_DIR, 'tests.log')
+
+# BEGIN Logger setup
+file_formatter = logging.Formatter(
+    '%(asctime)s:'
+    '%(filename)-24s:'
+    '%(name)-24s:'
+    '%(levelname)-10s:'
+    '%(funcName)-24s:'
+    '%(lineno)-4d:'
+    '%(message)s'
+)
+
+stream_formatter = logging.Formatter(
+    '%(levelname)-10s:'
+    '%(name)-20s:'
+    '%(message)s'
+)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(stream_formatter)
+stream_handler.setLevel(logging.INFO)
+
+
+class LogFileHandler(handlers.RotatingFileHandler):
+    """ A `RotatingFileHandler` that only opens its file when the first
+    record is written, creating the directory it's in if needed, so that
+    importing this module neither opens files nor fails without `logs/`. """
+    def __init__(self, filename, **kwargs):
+        super(LogFileHandler, self).__init__(filename, delay=True, **kwargs)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super(LogFileHandler, self)._open()
+
+
+searcher_handler = LogFileHandler(SEARCHER_LOG_PATH, maxBytes=500000,
+                                  backupCount=5)
+searcher_handler.setFormatter(file_formatter)
+searcher_handler.setLevel(logging.DEBUG)
+
+
+tests_handler = LogFileHandler(TESTS_LOG_PATH, maxBytes=500000,
+                               backupCount=1)
+tests_handler.setFormatter(file_formatter)
+tests_handler.setLevel(logging.DEBUG)
+
+
+logger = logging.getLogger('base')
+logger.setLevel(logging.DEBUG)
+logger.addHandler(searcher_handler)
+logger.addHandler(stream_handler)
+
+test_logger = logging.getLogger('base.tests')
+test_logger.addHandler(tests_handler)
+
+
+# BEGIN Queue logging
+queue_listener = None
+
+
+def start_queue_logging():
+    """ Moves the handlers of `logger` behind a `QueueHandler`, so records are
+    formatted and written by a `QueueListener` thread instead of the thread
+    that logged them. Returns the listener. """
+    global queue_listener
+    if queue_listener is not None:
+        return queue_listener
+
+    targets = logger.handlers[:]
+    for handler in targets:
+        logger.removeHandler(handler)
+
+    record_queue = queue.Queue()
+    logger.addHandler(handlers.QueueHandler(record_queue))
+    queue_listener = handlers.QueueListener(record_queue, *targets,
+                                            respect_handler_level=True)
+    queue_listener.start()
+    return queue_listener
+
+
+def stop_queue_logging():
+    """ Writes any queued records and restores the handlers moved by
+    `start_queue_logging`. """
+    global queue_listener
+    if queue_listener is None:
+        return
+
+    queue_listener.stop()
+    _restore_handlers()
+
+
+def detach_queue_logging():
+    """ Restores the handlers moved by `start_queue_logging` without stopping
+    the listener. For forked processes, which don't inherit the listener
+    thread. """
+    if queue_listener is not None:
+        _restore_handlers()
+
+
+def _restore_handlers():
+    global queue_listener
+    for handler in logger.handlers[:]:
+        if isinstance(handler, handlers.QueueHandler):
+            logger.removeHandler(handler)
+    for handler in queue_listener.handlers:
+        logger.addHandler(handler)
+    queue_listener = None